@@ -2,6 +2,21 @@ import pandas as pd
 import algoliasearch.search_client
 import datetime
 import argparse
+import json
+import math
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "Utils"))
+from stage_metrics import StageMetrics
+
+INDEX_NAME = "asknature_searchable_posts"
+# Largest page Algolia serves
+PAGE_SIZE = 1000
+DEFAULT_CONCURRENCY = 4
+COLUMNS = ["doi", "url", "label_level_1", "label_level_2", "label_level_3", "title", "abstract", "venue_names",
+           "full_doc_link", "is_open_access", "isBiomimicry"]
 
 
 def get_args():
@@ -18,10 +33,117 @@ def get_args():
                         help="Algolia App ID")
     parser.add_argument("api_key", type=str,
                         help="API Key for Algolia")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+                        help="Maximum number of result pages fetched at once")
+    parser.add_argument("--page-size", type=int, default=PAGE_SIZE,
+                        help="Number of hits requested per page")
+    parser.add_argument("--browse", action="store_true",
+                        help="Export with the browse API, which is not capped by the index's pagination limit but needs an API key with the browse right")
+    parser.add_argument("--local-hits", type=str, default=None,
+                        help="Serve hits from this JSON file instead of Algolia; app_id and api_key are then ignored")
     args = parser.parse_args()
     return args
 
 
+class LocalIndex:
+    """Stand-in for an Algolia index that serves hits from memory, for running the export without Algolia.
+    Filters are not evaluated; every hit is returned. Pages are cut like Algolia's, including its pagination limit.
+    Args:
+        hits : list
+            Objects to serve.
+        pagination_limit : int
+            Number of hits reachable through search pages, like Algolia's paginationLimitedTo, or None for no limit.
+    """
+
+    def __init__(self, hits: list, pagination_limit: int = None):
+        self.hits = hits
+        self.pagination_limit = pagination_limit
+        self.requests = 0
+
+    def search(self, query: str, request_options: dict = None):
+        self.requests += 1
+        options = request_options or {}
+        page = options.get("page", 0)
+        page_size = options.get("hitsPerPage", 20)
+        reachable = len(self.hits) if self.pagination_limit is None else min(len(self.hits), self.pagination_limit)
+        start = page * page_size
+        return {
+            "hits": self.hits[start:min(start + page_size, reachable)],
+            "nbHits": len(self.hits),
+            "page": page,
+            "nbPages": math.ceil(reachable / page_size),
+            "hitsPerPage": page_size
+        }
+
+    def browse_objects(self, request_options: dict = None):
+        self.requests += 1
+        return iter(self.hits)
+
+
+def get_index(app_id: str, api_key: str):
+    """Connects to the AskNature index on Algolia."""
+
+    client = algoliasearch.search_client.SearchClient.create(
+        app_id, api_key)
+    return client.init_index(INDEX_NAME)
+
+
+def get_filters():
+    """Builds the Algolia filter for biomimicry papers modified since the beginning of the current month."""
+
+    # Get timestamp of beginning of current month
+    current_date = datetime.datetime.now().replace(day=1, hour=0, minute=0, second=0)
+    earliest_timestamp = current_date.timestamp()
+    return "post_type_label:'Biological Strategies' AND post_modified > {}".format(earliest_timestamp)
+
+
+def iter_pages(index, filters: str, page_size: int = PAGE_SIZE, concurrency: int = DEFAULT_CONCURRENCY):
+    """Yields every page of hits matching the filters, fetching the pages after the first concurrently.
+    Pages are yielded in order as soon as they arrive, so the export is the same from run to run.
+    Args:
+        index : object
+            The Algolia index, or a stand-in with the same search method.
+        filters : str
+            Algolia filter expression.
+        page_size : int
+            Number of hits requested per page.
+        concurrency : int
+            Maximum number of pages fetched at once.
+    Returns:
+        iterator
+            Lists of hits, one per page.
+    """
+
+    def fetch(page):
+        return index.search("", {"filters": filters, "page": page, "hitsPerPage": page_size})
+
+    first = fetch(0)
+    pages = first.get("nbPages", 1)
+    if first.get("nbHits", 0) > pages * page_size:
+        print("Warning: only {} of {} hits are reachable through search pages; use --browse to export them all".format(
+            pages * page_size, first["nbHits"]))
+    yield first["hits"]
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for response in executor.map(fetch, range(1, pages)):
+            yield response["hits"]
+
+
+def iter_browse(index, filters: str, page_size: int = PAGE_SIZE):
+    """Yields every hit matching the filters in pages of page_size, using the browse API.
+    Browsing follows a cursor, so pages are fetched one after the other.
+    """
+
+    page = []
+    for hit in index.browse_objects({"filters": filters}):
+        page.append(hit)
+        if len(page) == page_size:
+            yield page
+            page = []
+    if page:
+        yield page
+
+
 def request_papers(app_id: str, api_key: str):
     """Utilizes the Algolia Search API to pull AskNature's papers.
     Args:
@@ -34,20 +156,9 @@ def request_papers(app_id: str, api_key: str):
             A list of objects representing the papers pull using the Algolia API
     """
 
-    # Get timestamp of beginning of current month
-    current_date = datetime.datetime.now().replace(day=1, hour=0, minute=0, second=0)
-    earliest_timestamp = current_date.timestamp()
-
-    # Initialize Algolia search client
-    client = algoliasearch.search_client.SearchClient.create(
-        app_id, api_key)
-    index = client.init_index("asknature_searchable_posts")
-
     # Search client for biomimicry papers modified this month
-    asknature_response = index.search(
-        "filters: post_type_label:'Biological Strategies' AND post_modified > {}".format(earliest_timestamp))["hits"]
-
-    return asknature_response
+    index = get_index(app_id, api_key)
+    return [hit for page in iter_pages(index, get_filters()) for hit in page]
 
 
 def process_papers(asknature_response: list):
@@ -127,11 +238,9 @@ def process_papers(asknature_response: list):
     return ask_dataframe
 
 
-if (__name__ == "__main__"):
-    args = get_args()
-    papers = request_papers(args.app_id, args.api_key)
-    asknature_dataframe = process_papers(papers)
-    # Add in the rest of the fields
+def add_fields(asknature_dataframe: pd.DataFrame):
+    """Adds the rest of the PeTaL fields, which AskNature does not provide."""
+
     size = asknature_dataframe.shape[0]
     asknature_dataframe["title"] = [""]*size
     asknature_dataframe["abstract"] = [""]*size
@@ -139,5 +248,48 @@ if (__name__ == "__main__"):
     asknature_dataframe["full_doc_link"] = [""]*size
     asknature_dataframe["is_open_access"] = [""]*size
     asknature_dataframe["isBiomimicry"] = ["Y"]*size
+    return asknature_dataframe.reindex(columns=COLUMNS)
 
-    asknature_dataframe.to_csv(args.output_file + ".csv", index=False)
+
+def export_papers(pages, output_path: str):
+    """Converts pages of hits into the PeTaL csv format and appends each to the output file as it arrives.
+    Args:
+        pages : iterator
+            Lists of hits, from iter_pages or iter_browse.
+        output_path : str
+            Path + filename of the output CSV.
+    Returns:
+        Tuple
+            int
+                Number of AskNature strategies read.
+            int
+                Number of papers written.
+    """
+
+    strategies = 0
+    rows = 0
+    pd.DataFrame(columns=COLUMNS).to_csv(output_path, index=False)
+    for hits in pages:
+        papers = add_fields(process_papers(hits))
+        papers.to_csv(output_path, mode="a", header=False, index=False)
+        strategies += len(hits)
+        rows += papers.shape[0]
+    return strategies, rows
+
+
+if (__name__ == "__main__"):
+    args = get_args()
+    with StageMetrics("pullAskNature") as metrics:
+        if args.local_hits:
+            with open(args.local_hits) as hits_file:
+                index = LocalIndex(json.load(hits_file))
+        else:
+            index = get_index(args.app_id, args.api_key)
+        if args.browse:
+            pages = iter_browse(index, get_filters(), args.page_size)
+        else:
+            pages = iter_pages(index, get_filters(), args.page_size, args.concurrency)
+        strategies, size = export_papers(pages, args.output_file + ".csv")
+        print("Exported {} papers from {} strategies".format(size, strategies))
+        metrics.add("strategies", strategies)
+        metrics.rows = size
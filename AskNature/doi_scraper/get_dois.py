@@ -1,10 +1,21 @@
 # A script that pulls DOI from any journal publication website
-import requests
 from bs4 import BeautifulSoup
 import re
 import argparse
 import pandas as pd
 import sys
+import os
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "Utils"))
+from http_client import HttpClient
+from stage_metrics import StageMetrics, ProgressPrinter
+
+# One pooled client shared by every scrape, limited to 2 requests per second per publisher
+client = HttpClient(
+    default_rate=2,
+    max_retries=3,
+    headers={
+        "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_4) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/83.0.4103.97 Safari/537.36"})
 
 
 def pull_doi(url: str):
@@ -17,9 +28,7 @@ def pull_doi(url: str):
             A string which is either empty or containing the paper's DOI.
     """
 
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_4) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/83.0.4103.97 Safari/537.36"}
-    r = requests.get(url, headers=headers)
+    r = client.get(url)
     html = r.text
     soup = BeautifulSoup(html, 'html.parser')
     doi = ''
@@ -58,10 +67,10 @@ def merge_dois(algolia_df: pd.DataFrame):
             A modified Pandas DataFrame of the input DataFrame where each DOI has been attempted to be filled.
     """
 
-    size = algolia_df.shape[0]
+    progress = ProgressPrinter(algolia_df.shape[0])
     algolia_df = algolia_df.fillna("")
-    for index, row in algolia_df.iterrows():
-        print("{:0.2%}".format(index/size))
+    for done, (index, row) in enumerate(algolia_df.iterrows(), 1):
+        progress.update(done)
         if not row.get("doi", False):
             continue
 
@@ -89,6 +98,9 @@ if __name__ == "__main__":
     parser.add_argument('algolia_papers', type=str,
                         help='File path of algolia paper csv')
     args = parser.parse_args()
-    alg = pd.read_csv(args.algolia_papers).astype({"doi": "string"})
-    alg = merge_dois(alg)
-    alg.to_csv("doi_scraped_papers.csv", index=False)
+    with StageMetrics("getDOIs") as metrics:
+        metrics.track_client(client)
+        alg = pd.read_csv(args.algolia_papers).astype({"doi": "string"})
+        alg = merge_dois(alg)
+        alg.to_csv("doi_scraped_papers.csv", index=False)
+        metrics.rows = alg.shape[0]
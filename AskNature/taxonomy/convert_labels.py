@@ -69,3 +69,49 @@ def convert_labels(function_map: list, labels: list):
     result[5].update(new_labels[5])
 
     return [list(item) for item in result[:-1]] + [result[-1]]
+
+
+# Columns produced for each AskNature level 3 label by compile_function_map
+LABEL_COLUMNS = ("level_1", "level_2", "level_3", "ask_level_1", "ask_level_2", "ask_level_3", "manual_label")
+
+
+def compile_function_map(function_map: list):
+    """Compiles the function map into a lookup table from AskNature level 3 label to the labels it produces.
+    Each entry follows convert_labels exactly: the first matching row of the map is used, a match on the first
+    row does not convert the label, and unknown labels take their AskNature labels from the last row.
+    Args:
+        function_map : list
+            List containing AskNature labels and their corresponding PeTaL equivalent labels.
+    Returns:
+        Tuple
+            dict
+                Maps each AskNature level 3 label to a tuple of LABEL_COLUMNS values, None where nothing is added.
+            tuple
+                The entry used for labels missing from the map.
+    """
+
+    petal_level_one, petal_level_two, petal_level_three, ask_level_one, ask_level_two, ask_level_three = function_map
+
+    def entry(index3: int, label: str):
+        petal = (None, None, None)
+        manual = False
+        if index3 > 0:
+            temp_label = petal_level_three[index3]
+            if temp_label == "keep":
+                petal = (petal_level_one[index3], petal_level_two[index3], label)
+            elif temp_label == "raise":
+                petal = (petal_level_one[index3], petal_level_two[index3], None)
+            elif temp_label == "delete":
+                pass
+            elif temp_label == "manual label":
+                manual = True
+            else:
+                petal = (petal_level_one[index3], petal_level_two[index3], temp_label)
+        ask = tuple(level[index3] or None for level in (ask_level_one, ask_level_two, ask_level_three))
+        return petal + ask + (manual,)
+
+    table = {}
+    for index3, label in enumerate(ask_level_three):
+        if label not in table:
+            table[label] = entry(index3, label)
+    return table, entry(-1, None)
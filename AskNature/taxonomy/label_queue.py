@@ -0,0 +1,232 @@
+import argparse
+import glob
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import time
+
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "Utils"))
+from paper_ids import normalize_doi, normalize_url
+
+STATUSES = ("pending", "exported", "labeled")
+
+
+def get_arg_parser():
+    """Allows arguments to be passed into this program through the terminal.
+    Returns:
+        argparse.Namespace: Object containing selected options
+    """
+
+    parser = argparse.ArgumentParser(description="Inspect and update the queue of papers waiting to be labeled by hand")
+    parser.add_argument("--queue", help="Path of the queue database", type=str,
+                        default="./PapersToLabel/label_queue.sqlite")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("status", help="Print the number of papers in each status")
+    export = commands.add_parser("export", help="Write the pending papers to a CSV file and mark them exported")
+    export.add_argument("output_csv", help="Path + filename of the CSV file to write", type=str)
+    mark = commands.add_parser("mark", help="Set the status of every queued paper found in a CSV file")
+    mark.add_argument("status", help="New status of the papers", choices=STATUSES)
+    mark.add_argument("csv_path", help="CSV file with doi and url columns, such as a file of labeled papers", type=str)
+    return parser.parse_args()
+
+
+def paper_keys(record: dict):
+    """Builds the keys a paper is found under: its normalized DOI and URL, or its title if it has neither.
+    A paper with none of the three is keyed by a hash of its content, so it is still queued exactly once.
+    Args:
+        record : dict
+            The paper, with optional "doi", "url" and "title" fields.
+    Returns:
+        list
+            Keys such as "doi:10.1234/ABC" and "url:example.com/paper".
+    """
+
+    keys = []
+    doi = normalize_doi(record.get("doi"))
+    if doi:
+        keys.append("doi:" + doi)
+    url = normalize_url(record.get("url"))
+    if url:
+        keys.append("url:" + url)
+    title = record.get("title")
+    if not keys and isinstance(title, str) and title.strip():
+        keys.append("title:" + " ".join(title.lower().split()))
+    if not keys:
+        content = json.dumps({key: value for key, value in record.items() if value is not None},
+                             sort_keys=True, default=str)
+        keys.append("content:" + hashlib.sha256(content.encode("utf8")).hexdigest())
+    return keys
+
+
+def frame_to_records(frame: pd.DataFrame):
+    """Turns a DataFrame into JSON serializable records, with missing values as None."""
+
+    return [{column: None if not isinstance(value, (list, dict)) and pd.isna(value) else value
+             for column, value in record.items()}
+            for record in frame.to_dict("records")]
+
+
+class LabelQueue:
+    """SQLite backed queue of papers waiting to be labeled by hand, keyed by normalized DOI and URL.
+    A paper is only queued once, however many runs flag it; its status then moves from pending to exported when it is
+    written to a CSV file for labelers, and to labeled once its labels come back.
+    Args:
+        path : str
+            Path + filename of the SQLite database.
+    """
+
+    def __init__(self, path: str):
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS papers ("
+            "id INTEGER PRIMARY KEY, record TEXT NOT NULL, status TEXT NOT NULL, "
+            "export_file TEXT, added_at REAL NOT NULL, updated_at REAL NOT NULL)")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS paper_keys ("
+            "key TEXT PRIMARY KEY, paper INTEGER NOT NULL REFERENCES papers (id))")
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS papers_status ON papers (status)")
+        self.connection.commit()
+
+    def is_empty(self):
+        return self.connection.execute("SELECT 1 FROM papers LIMIT 1").fetchone() is None
+
+    def find(self, keys: list):
+        """Returns the id of the queued paper stored under any of the keys, or None."""
+
+        if not keys:
+            return None
+        row = self.connection.execute(
+            "SELECT paper FROM paper_keys WHERE key IN ({})".format(", ".join("?" * len(keys))), keys).fetchone()
+        return row[0] if row else None
+
+    def add(self, records: list, status: str = "pending", export_file: str = None):
+        """Queues the papers that are not queued yet, matching on the keys given by paper_keys.
+        Keys a known paper did not have yet, such as a DOI found since it was queued, are added to it.
+        Args:
+            records : list
+                Papers as dicts of JSON serializable values.
+            status : str
+                Status given to the newly queued papers.
+            export_file : str
+                CSV file the papers were already exported to, if any.
+        Returns:
+            int
+                Number of papers newly queued.
+        """
+
+        added = 0
+        now = time.time()
+        with self.connection:
+            for record in records:
+                keys = paper_keys(record)
+                paper = self.find(keys)
+                if paper is None:
+                    paper = self.connection.execute(
+                        "INSERT INTO papers (record, status, export_file, added_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                        (json.dumps(record), status, export_file, now, now)).lastrowid
+                    added += 1
+                self.connection.executemany(
+                    "INSERT OR IGNORE INTO paper_keys (key, paper) VALUES (?, ?)", [(key, paper) for key in keys])
+        return added
+
+    def import_csvs(self, paths: list, status: str = "exported"):
+        """Queues the papers of CSV files handed to labelers before the queue existed, so they are not exported again.
+        Args:
+            paths : list
+                Paths + filenames of the CSV files, oldest first.
+            status : str
+                Status given to their papers.
+        Returns:
+            int
+                Number of papers queued.
+        """
+
+        added = 0
+        for path in paths:
+            added += self.add(frame_to_records(pd.read_csv(path)), status, os.path.basename(path))
+        return added
+
+    def set_status(self, records: list, status: str):
+        """Sets the status of every queued paper matching one of the records.
+        Args:
+            records : list
+                Papers as dicts with "doi", "url" or "title" fields.
+            status : str
+                One of STATUSES.
+        Returns:
+            int
+                Number of queued papers updated.
+        """
+
+        if status not in STATUSES:
+            raise ValueError("Unknown status: {!r}".format(status))
+        papers = {self.find(paper_keys(record)) for record in records} - {None}
+        with self.connection:
+            self.connection.executemany(
+                "UPDATE papers SET status = ?, updated_at = ? WHERE id = ?",
+                [(status, time.time(), paper) for paper in papers])
+        return len(papers)
+
+    def pending(self):
+        """Returns the pending papers as (id, record) tuples in the order they were queued."""
+
+        rows = self.connection.execute("SELECT id, record FROM papers WHERE status = 'pending' ORDER BY id")
+        return [(paper, json.loads(record)) for paper, record in rows]
+
+    def export_pending(self, path: str):
+        """Writes the pending papers to a CSV file and marks them exported.
+        Args:
+            path : str
+                Path + filename of the CSV file, which is only created if there are pending papers.
+        Returns:
+            int
+                Number of papers exported.
+        """
+
+        pending = self.pending()
+        if not pending:
+            return 0
+        pd.DataFrame([record for paper, record in pending]).to_csv(path, index=False)
+        with self.connection:
+            self.connection.executemany(
+                "UPDATE papers SET status = 'exported', export_file = ?, updated_at = ? WHERE id = ?",
+                [(os.path.basename(path), time.time(), paper) for paper, record in pending])
+        return len(pending)
+
+    def counts(self):
+        """Returns the number of papers in each status."""
+
+        counts = dict.fromkeys(STATUSES, 0)
+        counts.update(self.connection.execute("SELECT status, COUNT(*) FROM papers GROUP BY status"))
+        return counts
+
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
+
+
+def open_queue(path: str):
+    """Opens the queue, seeding a new one with the CSV files already in its folder so their papers are not queued again."""
+
+    queue = LabelQueue(path)
+    if queue.is_empty():
+        queue.import_csvs(sorted(glob.glob(os.path.join(os.path.dirname(path) or ".", "*.csv"))))
+    return queue
+
+
+if __name__ == "__main__":
+    args = get_arg_parser()
+    queue = open_queue(args.queue)
+    if args.command == "export":
+        print("Exported {} papers to {}".format(queue.export_pending(args.output_csv), args.output_csv))
+    elif args.command == "mark":
+        updated = queue.set_status(frame_to_records(pd.read_csv(args.csv_path)), args.status)
+        print("Marked {} papers as {}".format(updated, args.status))
+    for status, count in queue.counts().items():
+        print("{}: {}".format(status, count))
+    queue.close()
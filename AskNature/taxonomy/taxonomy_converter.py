@@ -1,8 +1,16 @@
 import argparse
 import os
+import re
+import sys
 import pandas as pd
 import convert_labels
 import glob
+from label_queue import frame_to_records, open_queue
+from taxonomy_map import TaxonomyMap
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "Utils"))
+from list_columns import decode_list_column
+from stage_metrics import StageMetrics
 
 def get_args():
     """Allows arguments to be passed into this program through the terminal.
@@ -15,71 +23,46 @@ def get_args():
     parser.add_argument('input_csv', type=str, help='CSV file with AN taxonomy')
     parser.add_argument('function_map', type=str, help='CSV file function mapping')
     parser.add_argument('output_csv', type=str, help='Updated CSV file')
+    parser.add_argument('--chunk-size', type=int, default=None,
+                        help='Convert the input this many papers at a time instead of loading it all at once')
+    parser.add_argument('--label-queue', type=str, default='./PapersToLabel/label_queue.sqlite',
+                        help='Database of papers queued for manual labeling')
     args = parser.parse_args()
 
     return args
 
 
-def get_function_map(function_map_name: str):
-    """Loads in the function map CSV as a Pandas DataFrame.
+def labels_to_list(label_column: pd.Series):
+    """Processes each stringified list of labels, lowering their case and converting them from a string into a list.
     Args:
-        function_map_name : str
-            Path + filename of the function map CSV.
+        label_column : pd.Series
+            Column of stringified lists.
     Returns:
         list
-            A list of nested lists containing the labels of AskNature and PeTaL
+            A list of nested lists containing the processed labels of the input AskNature papers.
     """
 
-    # returns function map as a list of 3 lists (lvl 1, lvl 2, and lvl 3 functions)
-    df = pd.read_csv(function_map_name)
-    df.fillna("", inplace=True)
-    for column in df.columns:
-        df[column] = df[column].str.lower()
-    
-    list_of_lists = [df["Level I"].tolist(), df["Level II"].tolist(),
-                     df["Level III"].tolist(), df["Alevel I"].tolist(), df["Alevel II"].tolist(),
-                     df["Alevel III"].tolist()]
-    return list_of_lists
+    return [[label.lower() for label in label_set]
+            for label_set in decode_list_column(label_column)]
 
 
-def get_labels(input_csv_filename: str):
-    """Loads in the labels from the CSV of papers we have. Each label is converted into a list from a string.
+def collect_labels(papers: list, labels: list):
+    """Groups exploded labels back per paper into the stringified lists convert_labels would have produced.
     Args:
-        input_csv_filename : str
-            Path + filename of the input CSV containing papers.
+        papers : list
+            Index of the paper each label belongs to.
+        labels : list
+            The labels, None where a label adds nothing.
     Returns:
-        list
-            A list of doubly nested lists [ [[a],[b],[c]], [...], [...] ] containing the labels of the AskNature papers from the input CSV.
+        dict
+            Maps each paper with labels to its stringified list.
     """
 
-    def labels_to_list(label_list: list):
-        """Processes each stringified list of labels, lowering their case and converting them from a string into a list.
-        Args:
-            label_lst : list
-                List of stringified lists.
-        Returns:
-            list
-                A list of nested lists containing the processed labels of the input AskNature papers.
-        """
-        new_list = []
-
-        for label_set in label_list:
-            if pd.isna(label_set):
-                new_list.append([])
-                continue
-            eval_list = eval(label_set)
-            new_list.append([label.lower() for label in eval_list])
-
-        return new_list
-
-    # returns list of lists of strings (labels), with each inner list corresponding to one paper
-    df = pd.read_csv(input_csv_filename)
-    all_bio_functions = []
-    all_bio_functions.append(labels_to_list(df["label_level_1"].tolist()))
-    all_bio_functions.append(labels_to_list(df["label_level_2"].tolist()))
-    all_bio_functions.append(labels_to_list(df["label_level_3"].tolist()))
-
-    return all_bio_functions
+    grouped = {}
+    for paper, label in zip(papers, labels):
+        if isinstance(label, str):
+            grouped.setdefault(paper, []).append(label)
+    return {paper: str(list(set(paper_labels))) for paper, paper_labels in grouped.items()}
 
 
 def prepare_csv(input_csv_filename: str, function_map_csv: str):
@@ -94,53 +77,155 @@ def prepare_csv(input_csv_filename: str, function_map_csv: str):
             The final DataFrame containing all of the papers which have either had their labels converted or were marked with a 'manual label' flag.
     """
 
-    multi_level_labels = get_labels(input_csv_filename)
     df = pd.read_csv(input_csv_filename)
-    function_map = get_function_map(function_map_csv)
-
-    for index in df.index:
-        new_functions = convert_labels.convert_labels(function_map,
-                                                      [
-                                                          multi_level_labels[0][index],
-                                                          multi_level_labels[1][index],
-                                                          multi_level_labels[2][index]
-                                                      ])
-        
-        df.loc[index, "label_level_1"] = str(new_functions[0])
-        df.loc[index, "label_level_2"] = str(new_functions[1])
-        df.loc[index, "label_level_3"] = str(new_functions[2])
-        df.loc[index, "ask_label_level_1"] = str(new_functions[3])
-        df.loc[index, "ask_label_level_2"] = str(new_functions[4])
-        df.loc[index, "ask_label_level_3"] = str(new_functions[5])
-        df.loc[index, "manual_label"] = new_functions[6]
+    return convert_frame(df, TaxonomyMap.load(function_map_csv))
 
-    return df
 
-def separate_manual_labels(full_dataframe: pd.DataFrame):
-    """Separates the papers with the 'manual label' flag out from the rest.
+def convert_frame(df: pd.DataFrame, taxonomy_map: TaxonomyMap):
+    """Converts the labels of a DataFrame of AskNature papers, replacing its label columns in place.
+    The level 3 labels of every paper are exploded into one row per label, merged with the compiled function map
+    and grouped back per paper.
     Args:
-        full_dataframe : pd.DataFrame
-            DataFrame containing either converted papers or papers with the 'manual label' flag.
+        df : pd.DataFrame
+            AskNature papers, the whole input CSV or one chunk of it.
+        taxonomy_map : TaxonomyMap
+            The compiled function map.
     Returns:
         pd.DataFrame
-            A DataFrame without any papers requiring manual labeling.
+            The same DataFrame with converted labels and a 'manual_label' flag.
     """
 
+    columns = list(convert_labels.LABEL_COLUMNS)
+
+    labels = pd.Series(labels_to_list(df["label_level_3"]), index=df.index, dtype=object).explode().dropna()
+    merged = labels.rename("label").to_frame().merge(
+        taxonomy_map.lookup_frame(), left_on="label", right_index=True, how="left", indicator=True)
+    unmatched = (merged["_merge"] == "left_only").to_numpy()
+    for column, value in zip(columns, taxonomy_map.unmatched_entry):
+        merged.loc[unmatched, column] = value
+
+    papers = merged.index.tolist()
+    converted = {column: collect_labels(papers, merged[column].tolist()) for column in columns[:-1]}
+    manual_label = merged["manual_label"].astype(bool).groupby(level=0).any()
+
+    for output_column, column in (("label_level_1", "level_1"), ("label_level_2", "level_2"),
+                                  ("label_level_3", "level_3"), ("ask_label_level_1", "ask_level_1"),
+                                  ("ask_label_level_2", "ask_level_2"), ("ask_label_level_3", "ask_level_3")):
+        df[output_column] = [converted[column].get(paper, "[]") for paper in df.index]
+    df["manual_label"] = manual_label.reindex(df.index, fill_value=False).astype(bool)
+
+    return df
+
+def split_manual_labels(full_dataframe: pd.DataFrame):
+    """Splits the papers with the 'manual label' flag from the rest, dropping the flag from the papers to label."""
+
     updated_df = full_dataframe[full_dataframe["manual_label"] == False].copy()
     manual_df = full_dataframe[full_dataframe["manual_label"] == True].copy()
-    if not manual_df.empty:
-        csv_count = len(glob.glob("./PapersToLabel/*.csv"))
-        manual_df.drop("manual_label", inplace = True, axis = 1)
-        manual_df.to_csv(f"./PapersToLabel/papers_to_label_{csv_count}.csv", index=False)
+    manual_df.drop("manual_label", inplace = True, axis = 1)
+    return updated_df, manual_df
+
+
+def next_manual_label_path():
+    """Numbers the next papers to label file one past the highest existing number, so no earlier file is overwritten."""
+
+    numbers = [int(match.group(1)) for match in
+               (re.fullmatch(r"papers_to_label_(\d+)\.csv", os.path.basename(path))
+                for path in glob.glob("./PapersToLabel/papers_to_label_*.csv")) if match]
+    return f"./PapersToLabel/papers_to_label_{max(numbers, default=-1) + 1}.csv"
+
+
+def separate_manual_labels(full_dataframe: pd.DataFrame, queue):
+    """Separates the papers with the 'manual label' flag out from the rest, adding those not seen before to the label queue.
+    Args:
+        full_dataframe : pd.DataFrame
+            DataFrame containing either converted papers or papers with the 'manual label' flag.
+        queue : LabelQueue
+            Queue of papers waiting to be labeled by hand.
+    Returns:
+        Tuple
+            pd.DataFrame
+                A DataFrame without any papers requiring manual labeling.
+            int
+                Number of papers newly added to the queue.
+    """
+
+    updated_df, manual_df = split_manual_labels(full_dataframe)
+    added = queue.add(frame_to_records(manual_df)) if not manual_df.empty else 0
+
+    return updated_df, added
+
+
+def stream_csv(input_csv_filename: str, function_map_csv: str, output_paths: list, chunk_size: int, queue):
+    """Converts the input CSV in a single pass, chunk_size papers at a time, so memory use does not grow with the input.
+    Every output path is rewritten with the header, then each converted chunk is appended to it and its manual label
+    papers are added to the label queue.
+    Cells are read as text so every chunk writes them back the way they were read, rather than with whatever type
+    pandas would infer for that chunk.
+    Args:
+        input_csv_filename : str
+            Path + filename of the input CSV.
+        function_map_csv : str
+            Path + filename of the function map CSV.
+        output_paths : list
+            Paths + filenames the converted papers are written to.
+        chunk_size : int
+            Number of papers read and converted at a time.
+        queue : LabelQueue
+            Queue of papers waiting to be labeled by hand.
+    Returns:
+        Tuple
+            int
+                Number of papers read.
+            int
+                Number of papers flagged for manual labeling.
+            int
+                Number of those newly added to the queue.
+    """
+
+    taxonomy_map = TaxonomyMap.load(function_map_csv)
+
+    # Rewrite every output with just its header first, so an input without papers still replaces the last run's output
+    header = convert_frame(pd.read_csv(input_csv_filename, dtype=str, nrows=0), taxonomy_map)
+    for path in output_paths:
+        header.to_csv(path, index=False)
+
+    rows = 0
+    manual_rows = 0
+    added = 0
+    for chunk in pd.read_csv(input_csv_filename, dtype=str, chunksize=chunk_size):
+        converted = convert_frame(chunk, taxonomy_map)
+        updated_df, chunk_added = separate_manual_labels(converted, queue)
+        for path in output_paths:
+            updated_df.to_csv(path, mode="a", header=False, index=False)
+        rows += chunk.shape[0]
+        manual_rows += chunk.shape[0] - updated_df.shape[0]
+        added += chunk_added
 
-    return updated_df
+    return rows, manual_rows, added
 
 
 if (__name__ == "__main__"):
 
     args = get_args()
-    function_map = args.function_map
-    converted_dataframe = prepare_csv(args.input_csv, function_map)
-    final_dataframe = separate_manual_labels(converted_dataframe)
-    final_dataframe.to_csv("./AskNature/taxonomy/converted_paper.csv", index=False)
-    final_dataframe.to_csv(args.output_csv + ".csv", index=False)
+    with StageMetrics("convertAskNatureTaxonomy") as metrics:
+        function_map = args.function_map
+        queue = open_queue(args.label_queue)
+        if args.chunk_size:
+            rows, manual_rows, added = stream_csv(
+                args.input_csv, function_map, ["./AskNature/taxonomy/converted_paper.csv", args.output_csv + ".csv"],
+                args.chunk_size, queue)
+        else:
+            converted_dataframe = prepare_csv(args.input_csv, function_map)
+            final_dataframe, added = separate_manual_labels(converted_dataframe, queue)
+            final_dataframe.to_csv("./AskNature/taxonomy/converted_paper.csv", index=False)
+            final_dataframe.to_csv(args.output_csv + ".csv", index=False)
+            rows = converted_dataframe.shape[0]
+            manual_rows = rows - final_dataframe.shape[0]
+
+        # Only papers that were never queued before end up in the new file for labelers
+        exported = queue.export_pending(next_manual_label_path())
+        queue.close()
+        print("Papers needing manual labels: {} ({} new, {} exported)".format(manual_rows, added, exported))
+        metrics.rows = rows
+        metrics.add("manual_label_rows", manual_rows)
+        metrics.add("manual_label_new", added)
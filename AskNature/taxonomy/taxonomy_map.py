@@ -0,0 +1,119 @@
+import hashlib
+import os
+import pickle
+import tempfile
+
+import pandas as pd
+
+import convert_labels
+
+# Bump when the cached layout changes so old caches are rebuilt
+CACHE_VERSION = 2
+FUNCTION_MAP_COLUMNS = ("Level I", "Level II", "Level III", "Alevel I", "Alevel II", "Alevel III")
+
+
+def cache_path_for(csv_path: str):
+    return os.path.splitext(csv_path)[0] + ".pickle"
+
+
+def file_hash(path: str):
+    with open(path, "rb") as csv_file:
+        return hashlib.sha256(csv_file.read()).hexdigest()
+
+
+# The compiled table is only valid for the compile_function_map that built it
+COMPILER_HASH = file_hash(convert_labels.__file__)
+
+
+class TaxonomyMap:
+    """The AskNature to PeTaL function map, parsed and compiled once into a label lookup table.
+    Use TaxonomyMap.load to get one; the compiled table is read from a binary cache next to the CSV while the SHA-256
+    of the CSV and of convert_labels.py match, and rebuilt from the CSV otherwise.
+    Args:
+        levels : list
+            The six function map columns, lowercased: PeTaL levels 1 to 3, then AskNature levels 1 to 3.
+        source_hash : str
+            SHA-256 of the CSV the levels were read from.
+        compiled : tuple
+            The (table, unmatched_entry) pair from convert_labels.compile_function_map, compiled here if not given.
+    """
+
+    def __init__(self, levels: list, source_hash: str, compiled: tuple = None):
+        self.levels = levels
+        self.source_hash = source_hash
+        self.table, self.unmatched_entry = compiled or convert_labels.compile_function_map(levels)
+        self._lookup_frame = None
+
+    @classmethod
+    def from_csv(cls, csv_path: str, source_hash: str = None):
+        """Parses the function map CSV, lowercasing every label."""
+
+        df = pd.read_csv(csv_path)
+        df.fillna("", inplace=True)
+        levels = [df[column].str.lower().tolist() for column in FUNCTION_MAP_COLUMNS]
+        return cls(levels, source_hash or file_hash(csv_path))
+
+    @classmethod
+    def load(cls, csv_path: str, cache_path: str = None):
+        """Loads the taxonomy map for a function map CSV, rebuilding the cache if the CSV has changed.
+        Args:
+            csv_path : str
+                Path + filename of the function map CSV.
+            cache_path : str
+                Path + filename of the cache, next to the CSV with a .pickle extension by default.
+        Returns:
+            TaxonomyMap
+                The compiled map.
+        """
+
+        cache_path = cache_path or cache_path_for(csv_path)
+        source_hash = file_hash(csv_path)
+        if os.path.isfile(cache_path):
+            try:
+                with open(cache_path, "rb") as cache_file:
+                    version, cached_hash, compiler_hash, levels, compiled = pickle.load(cache_file)
+                if version == CACHE_VERSION and cached_hash == source_hash and compiler_hash == COMPILER_HASH:
+                    return cls(levels, source_hash, compiled)
+            except (OSError, pickle.UnpicklingError, EOFError, ValueError):
+                pass
+
+        taxonomy_map = cls.from_csv(csv_path, source_hash)
+        taxonomy_map.save(cache_path)
+        return taxonomy_map
+
+    def save(self, cache_path: str):
+        """Writes the cache atomically so concurrent consumers never read a partial file."""
+
+        handle, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(cache_path)), suffix=".tmp")
+        with os.fdopen(handle, "wb") as cache_file:
+            pickle.dump((CACHE_VERSION, self.source_hash, COMPILER_HASH, self.levels,
+                         (self.table, self.unmatched_entry)), cache_file, pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, cache_path)
+
+    def lookup_frame(self):
+        """Returns the lookup table as a DataFrame indexed by AskNature level 3 label, one column per LABEL_COLUMNS entry."""
+
+        if self._lookup_frame is None:
+            self._lookup_frame = pd.DataFrame.from_dict(self.table, orient="index",
+                                                        columns=list(convert_labels.LABEL_COLUMNS))
+        return self._lookup_frame
+
+    def convert(self, labels: list):
+        """Converts one paper's AskNature level 3 labels, giving the same result as convert_labels.convert_labels.
+        Args:
+            labels : list
+                Lowercased AskNature level 3 labels of the paper.
+        Returns:
+            list
+                PeTaL levels 1 to 3, AskNature levels 1 to 3 and the manual label flag.
+        """
+
+        result = [[], [], [], [], [], []]
+        manual = False
+        for label in labels:
+            entry = self.table.get(label, self.unmatched_entry)
+            for level, value in zip(result, entry[:-1]):
+                if value is not None:
+                    level.append(value)
+            manual = manual or entry[-1]
+        return [list(set(level)) for level in result] + [manual]
@@ -1,20 +1,27 @@
-import great_expectations as ge
-import importlib.util
-spec_unique = importlib.util.spec_from_file_location("expect_non_empty_unique", "./great_expectations/plugins/custom_modules/expect_non_empty_unique.py")
-expect_non_empty_unique = importlib.util.module_from_spec(spec_unique)
-spec_unique.loader.exec_module(expect_non_empty_unique)
-spec_list = importlib.util.spec_from_file_location("expect_type_list", "./great_expectations/plugins/custom_modules/expect_type_list.py")
-expect_type_list = importlib.util.module_from_spec(spec_list)
-spec_list.loader.exec_module(expect_type_list)
-spec_list = importlib.util.spec_from_file_location("expect_column_list_to_be_in_set", "./great_expectations/plugins/custom_modules/expect_column_list_to_be_in_set.py")
-expect_column_list_to_be_in_set = importlib.util.module_from_spec(spec_list)
-spec_list.loader.exec_module(expect_column_list_to_be_in_set)
-
-"""
-The actual Great Expectations cli commands cannot handle custom expectations. So this file exists just to import these
-custom files before running the Great Expectations validation.
-"""
-
-if __name__ == "__main__":
-    context = ge.get_context()
-    context.run_checkpoint(checkpoint_name="main-val")
\ No newline at end of file
+import great_expectations as ge
+import importlib.util
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Utils"))
+from stage_metrics import StageMetrics
+spec_unique = importlib.util.spec_from_file_location("expect_non_empty_unique", "./great_expectations/plugins/custom_modules/expect_non_empty_unique.py")
+expect_non_empty_unique = importlib.util.module_from_spec(spec_unique)
+spec_unique.loader.exec_module(expect_non_empty_unique)
+spec_list = importlib.util.spec_from_file_location("expect_type_list", "./great_expectations/plugins/custom_modules/expect_type_list.py")
+expect_type_list = importlib.util.module_from_spec(spec_list)
+spec_list.loader.exec_module(expect_type_list)
+spec_list = importlib.util.spec_from_file_location("expect_column_list_to_be_in_set", "./great_expectations/plugins/custom_modules/expect_column_list_to_be_in_set.py")
+expect_column_list_to_be_in_set = importlib.util.module_from_spec(spec_list)
+spec_list.loader.exec_module(expect_column_list_to_be_in_set)
+
+"""
+The actual Great Expectations cli commands cannot handle custom expectations. So this file exists just to import these
+custom files before running the Great Expectations validation.
+"""
+
+if __name__ == "__main__":
+    with StageMetrics("validate") as metrics:
+        context = ge.get_context()
+        result = context.run_checkpoint(checkpoint_name="main-val")
+        # Stored as 1 or 0 so dvc metrics diff treats it like the other numeric metrics
+        metrics.add("validation_success", int(result.success))
\ No newline at end of file
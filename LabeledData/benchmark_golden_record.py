@@ -0,0 +1,47 @@
+"""Compares the memory used by golden records stored as dicts and as GoldenRecord objects.
+
+Usage: python benchmark_golden_record.py [number_of_records]
+"""
+import sys
+import tracemalloc
+
+from golden_record import GOLDEN_FIELDS, GoldenRecord
+
+
+def make_fields(index: int):
+    """Builds the field values of one synthetic paper, shaped like the output of convert_to_json."""
+
+    fields = {field: [] for field in GOLDEN_FIELDS}
+    fields.update({
+        "paper": "W{}".format(index),
+        "title": "Title of paper {}".format(index),
+        "abstract": "Abstract of paper {}".format(index),
+        "isOpenAccess": bool(index % 2),
+        "fullDocLink": "https://example.org/{}".format(index),
+        "petalID": index,
+        "doi": "10.1234/PAPER.{}".format(index),
+        "isBiomimicry": "Y",
+        "url": "https://example.org/paper/{}".format(index),
+    })
+    return fields
+
+
+def measure(build, count: int):
+    """Returns the peak traced memory in bytes while holding `count` records built by `build`."""
+
+    tracemalloc.start()
+    records = [build(make_fields(index)) for index in range(count)]
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del records
+    return peak
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    dict_peak = measure(dict, count)
+    record_peak = measure(lambda fields: GoldenRecord(**fields), count)
+    print("Records: {}".format(count))
+    print("dict:         {:10.1f} MiB".format(dict_peak / 2**20))
+    print("GoldenRecord: {:10.1f} MiB".format(record_peak / 2**20))
+    print("Saved:        {:10.1%}".format(1 - record_peak / dict_peak))
@@ -1,7 +1,11 @@
 import pandas as pd
 import os
+import sys
 import glob
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Utils"))
+from stage_metrics import StageMetrics
+
 
 def merge_dataframes(dataframes: list):
     """Merges a list of DataFrames together.
@@ -17,17 +21,20 @@ def merge_dataframes(dataframes: list):
     return merged
 
 if __name__ == "__main__":
-    if os.path.isfile("merged_dataframes.csv"):
-        os.remove("merged_dataframes.csv")
-    csv_paths = glob.glob("*.csv")
-    print("Files merged: ", csv_paths)
-    dataframes = [pd.read_csv(path, encoding="utf8") for path in csv_paths]
-    json_paths = glob.glob("*.json")
-    print("Files merged: ", json_paths)
-    dataframes.extend([pd.read_json(path) for path in json_paths])
-    merged = merge_dataframes(dataframes)
-    merged.to_csv("merged_dataframes.csv", index=False)
-    for path in csv_paths:
-        os.remove(path)
-    for path in json_paths:
-        os.remove(path)
\ No newline at end of file
+    with StageMetrics("combine") as metrics:
+        if os.path.isfile("merged_dataframes.csv"):
+            os.remove("merged_dataframes.csv")
+        csv_paths = glob.glob("*.csv")
+        print("Files merged: ", csv_paths)
+        dataframes = [pd.read_csv(path, encoding="utf8") for path in csv_paths]
+        json_paths = glob.glob("*.json")
+        print("Files merged: ", json_paths)
+        dataframes.extend([pd.read_json(path) for path in json_paths])
+        merged = merge_dataframes(dataframes)
+        merged.to_csv("merged_dataframes.csv", index=False)
+        metrics.rows = merged.shape[0]
+        metrics.add("files", len(csv_paths) + len(json_paths))
+        for path in csv_paths:
+            os.remove(path)
+        for path in json_paths:
+            os.remove(path)
\ No newline at end of file
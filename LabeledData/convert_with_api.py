@@ -6,12 +6,29 @@ import json
 import requests
 import traceback
 import os
+import sys
 import argparse
 import ast
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from openalex_cache import OpenAlexCache
+from golden_record import GoldenRecord
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Utils"))
+import json_stream
+from list_columns import parse_list_cell
+from http_client import HttpClient
+from stage_metrics import StageMetrics, ProgressPrinter
 
 # Global Variables
 stopwords = nltk.corpus.stopwords.words('english')
 special_characters = string.punctuation
+OPENALEX_URL = "https://api.openalex.org/works/"
+DEFAULT_CONCURRENCY = 8
+BATCH_PAGE_SIZE = 200
+# Open Alex accepts at most this many values in one OR filter
+MAX_BATCH_SIZE = 50
+client = HttpClient(rate_limits={"api.openalex.org": 10})
 
 
 def get_arg_parser():
@@ -30,7 +47,29 @@ def get_arg_parser():
     parser.add_argument(
         "csv_path", help="Full path to CSV labeled file", type=dir_path)
     parser.add_argument("output_name", help="Name of output file", type=str)
-    return parser.parse_args()
+    parser.add_argument("--concurrency", help="Maximum number of concurrent Open Alex requests",
+                        type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument("--batch-size", help="Number of DOIs or Open Alex IDs per request (0 disables batching, Open Alex allows up to 50)",
+                        type=int, default=0)
+    parser.add_argument("--cache", help="Path to the SQLite cache of Open Alex responses",
+                        type=str, default=None)
+    parser.add_argument("--cache-only", help="Only use cached responses, stale ones included, making no requests",
+                        action="store_true")
+    parser.add_argument("--refresh-older-than", help="Re-fetch cached papers older than this many days",
+                        type=float, default=None)
+    parser.add_argument("--cache-ttl", help="Evict cached papers older than this many days",
+                        type=float, default=None)
+    parser.add_argument("--cache-max-entries", help="Maximum number of cache entries to keep",
+                        type=int, default=None)
+    parser.add_argument("--max-abstract-words", help="Truncate abstracts rebuilt from Open Alex to this many words",
+                        type=int, default=None)
+    parser.add_argument("--json-array", help="Write a bracketed JSON array instead of newline-delimited JSON",
+                        action="store_true")
+
+    args = parser.parse_args()
+    if not 0 <= args.batch_size <= MAX_BATCH_SIZE:
+        parser.error("--batch-size must be between 1 and {}, or 0 to disable batching".format(MAX_BATCH_SIZE))
+    return args
 
 
 def clean_labels(labels: list):
@@ -49,28 +88,284 @@ def clean_labels(labels: list):
 
 
 def build_abstract(inverted_ind:dict):
-    # Find length
-    maxInd = 0
-    
-    for indices in inverted_ind.values():
-        if max(indices) > maxInd:
-            maxInd = max(indices)
-    abstract_list = ["-"]*(maxInd + 1)
-    
-    for word in inverted_ind.keys():
-        for index in inverted_ind[word]:
-            abstract_list[index] = word
-    full_abstract = " ".join(abstract_list)
-    full_abstract = re.sub(" -(.*)- ", " ", full_abstract)
-
-    return " ".join(abstract_list)
-
-
-def get_api_data(dataframe: pd.DataFrame):
+    return build_abstracts([inverted_ind])[0]
+
+
+def build_abstracts(inverted_indexes: list, max_words: int = None):
+    """Rebuilds many abstracts at once from Open Alex abstract_inverted_index objects.
+    Args:
+        inverted_indexes : list
+            One {word: [positions]} dictionary per paper (empty or None for no abstract).
+        max_words : int
+            Optional cap on the number of word positions kept per abstract.
+    Returns:
+        list
+            One abstract string per paper, with "-" in positions no word fills.
+    """
+
+    abstracts = []
+    for inverted_ind in inverted_indexes:
+        if not inverted_ind:
+            abstracts.append("")
+            continue
+
+        length = max(map(max, inverted_ind.values())) + 1
+        if max_words is not None:
+            length = min(length, max_words)
+        abstract_list = ["-"]*length
+        for word, indices in inverted_ind.items():
+            for index in indices:
+                if index < length:
+                    abstract_list[index] = word
+        abstracts.append(" ".join(abstract_list))
+
+    return abstracts
+
+
+def build_request_keys(dataframe: pd.DataFrame):
+    """Picks the identifier used to look up every row of the imported DataFrame.
+    Args:
+        dataframe : pd.DataFrame
+            Dataframe of our labeled data.
+    Returns:
+        list
+            A list with one (filter name, value) tuple per row, or None where the row has no DOI.
+    """
+
+    keys = []
+    for i, doi in enumerate(dataframe["doi"].tolist()):
+        if (doi == ""):
+            keys.append(None)
+        elif (len(dataframe.iloc[i].get("paper", "")) > 0):
+            keys.append(("openalex_id", dataframe.iloc[i]["paper"]))
+        else:
+            keys.append(("doi", doi))
+    return keys
+
+
+def build_request_url(key: tuple, base_url: str = OPENALEX_URL):
+    """Builds the single paper Open Alex URL for a request key.
+    Args:
+        key : tuple
+            A (filter name, value) tuple from build_request_keys.
+        base_url : str
+            Root of the Open Alex works endpoint.
+    Returns:
+        str
+            The request URL, or None if the key is None.
+    """
+
+    if key is None:
+        return None
+    filter_name, value = key
+    if filter_name == "openalex_id":
+        return base_url + value
+    return base_url + "doi:" + value
+
+
+def response_keys(paper: dict):
+    """Lists the request keys that identify a paper returned by Open Alex.
+    Args:
+        paper : dict
+            The paper in a JSON format.
+    Returns:
+        list
+            (filter name, value) tuples for the paper's Open Alex ID and DOI.
+    """
+
+    keys = []
+    oa_id = extract_oa_id(paper.get("id"))
+    if oa_id:
+        keys.append(("openalex_id", oa_id))
+    doi = extract_dois(paper.get("doi") or "")
+    if doi:
+        keys.append(("doi", doi))
+    return keys
+
+
+def fetch_paper(url: str):
+    """Makes a single GET request to Open Alex.
+    Args:
+        url : str
+            Full request URL for one paper.
+    Returns:
+        dict
+            The paper in a JSON format, or None if the request was unsuccessful.
+    """
+
+    try:
+        r = client.get(url)
+    except requests.RequestException as error:
+        print("Request failed for {}: {}".format(url, error))
+        return None
+    if (r.status_code == 200):
+        return json.loads(r.text)
+    if (r.status_code != 404):
+        print("Request failed for {}: HTTP {}".format(url, r.status_code))
+    return None
+
+
+def fetch_batch(batch: tuple, base_url: str = OPENALEX_URL):
+    """Looks up several papers at once with an Open Alex OR filter, following every result page.
+    Args:
+        batch : tuple
+            A (filter name, list of values) tuple.
+        base_url : str
+            Root of the Open Alex works endpoint.
+    Returns:
+        list
+            Every paper returned for the batch in a JSON format.
+    """
+
+    filter_name, values = batch
+    params = {
+        "filter": "{}:{}".format(filter_name, "|".join(values)),
+        "per-page": BATCH_PAGE_SIZE,
+        "cursor": "*"
+    }
+    results = []
+    while params["cursor"]:
+        try:
+            r = client.get(base_url.rstrip("/"), params=params)
+        except requests.RequestException as error:
+            print("Batch request failed for {}: {}".format(params["filter"], error))
+            break
+        if (r.status_code != 200):
+            print("Batch request failed for {}: HTTP {}".format(params["filter"], r.status_code))
+            break
+        page = json.loads(r.text)
+        results.extend(page.get("results", []))
+        if not page.get("results"):
+            break
+        params["cursor"] = page.get("meta", {}).get("next_cursor")
+    return results
+
+
+async def run_concurrently(function, items: list, concurrency: int = DEFAULT_CONCURRENCY):
+    """Calls a blocking function on every item from a bounded thread pool, keeping the order of the input.
+    Args:
+        function : callable
+            Function taking a single item.
+        items : list
+            Items to process, where None entries are skipped.
+        concurrency : int
+            Maximum number of calls in flight at once.
+    Returns:
+        list
+            The result for each item (or None) in the same order as items.
+    """
+
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(concurrency)
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    progress = ProgressPrinter(sum(item is not None for item in items))
+    done = 0
+
+    async def run(item):
+        nonlocal done
+        if item is None:
+            return None
+        async with semaphore:
+            try:
+                return await loop.run_in_executor(executor, function, item)
+            finally:
+                done += 1
+                progress.update(done)
+
+    try:
+        return await asyncio.gather(*[run(item) for item in items])
+    finally:
+        executor.shutdown(wait=False)
+
+
+def fetch_papers(keys: list, concurrency: int = DEFAULT_CONCURRENCY,
+                 base_url: str = OPENALEX_URL):
+    """Fetches one paper per request key with a separate request for each.
+    Args:
+        keys : list
+            Request keys from build_request_keys.
+        concurrency : int
+            Maximum number of requests in flight at once.
+        base_url : str
+            Root of the Open Alex works endpoint.
+    Returns:
+        list
+            The response for each key (or None) in the same order as keys.
+    """
+
+    urls = [build_request_url(key, base_url) for key in keys]
+    return asyncio.run(run_concurrently(fetch_paper, urls, concurrency))
+
+
+def fetch_papers_batched(keys: list, batch_size: int, concurrency: int = DEFAULT_CONCURRENCY,
+                         base_url: str = OPENALEX_URL):
+    """Fetches papers in groups of up to batch_size identifiers and maps the results back to the keys.
+    Args:
+        keys : list
+            Request keys from build_request_keys.
+        batch_size : int
+            Maximum number of identifiers per request.
+        concurrency : int
+            Maximum number of requests in flight at once.
+        base_url : str
+            Root of the Open Alex works endpoint.
+    Returns:
+        list
+            The response for each key (or None) in the same order as keys.
+    """
+
+    # Identifiers containing filter separators cannot be batched and fall back to single lookups.
+    # Dicts keep first-seen order while deduplicating in constant time.
+    grouped = {"doi": {}, "openalex_id": {}}
+    single_keys = [None]*len(keys)
+    for i, key in enumerate(keys):
+        if key is None:
+            continue
+        if "," in key[1] or "|" in key[1]:
+            single_keys[i] = key
+        else:
+            grouped[key[0]].setdefault(key[1])
+
+    batches = []
+    for filter_name, values in grouped.items():
+        values = list(values)
+        for start in range(0, len(values), batch_size):
+            batches.append((filter_name, values[start:start + batch_size]))
+
+    batch_results = asyncio.run(run_concurrently(
+        lambda batch: fetch_batch(batch, base_url), batches, concurrency))
+
+    found = {}
+    for results in batch_results:
+        for paper in results or []:
+            for key in response_keys(paper):
+                found[(key[0], key[1].upper())] = paper
+
+    responses = [key and found.get((key[0], key[1].upper())) for key in keys]
+    if any(single_keys):
+        for i, paper in enumerate(fetch_papers(single_keys, concurrency, base_url)):
+            if paper is not None:
+                responses[i] = paper
+    return responses
+
+
+def get_api_data(dataframe: pd.DataFrame, concurrency: int = DEFAULT_CONCURRENCY,
+                 base_url: str = OPENALEX_URL, batch_size: int = 0,
+                 cache: OpenAlexCache = None, cache_only: bool = False):
     """Uses DOIs from the imported DataFrame to make queries to Open ALex.
     Args:
         dataframe : pd.DataFrame
             Dataframe of our labeled data.
+        concurrency : int
+            Maximum number of requests in flight at once.
+        base_url : str
+            Root of the Open Alex works endpoint.
+        batch_size : int
+            Number of identifiers to look up per request, or 0 to request each paper separately.
+        cache : OpenAlexCache
+            Optional cache of earlier responses; only missing or stale papers are requested.
+        cache_only : bool
+            Skip the network entirely and use only what the cache holds, stale entries included.
     Returns:
         Tuple
             list
@@ -79,34 +374,40 @@ def get_api_data(dataframe: pd.DataFrame):
                 A list consisting of only the papers DOIs.
     """
 
-    # Define GET parameters
-    url = "https://api.openalex.org/works/doi:"
-    urlID = "https://api.openalex.org/works/"
-
-    # Make DOI requests in batches
     paper_dois = dataframe["doi"].tolist()
+    keys = build_request_keys(dataframe)
+    responses = [None]*len(keys)
+    if cache is not None:
+        # Stale entries cannot be refreshed without the network, so they are better than nothing
+        responses = [key and cache.get(key, allow_stale=cache_only) for key in keys]
+    fetch_keys = [None if (cache_only or responses[i] is not None) else key
+                  for i, key in enumerate(keys)]
+
+    if any(fetch_keys):
+        if batch_size > 0:
+            fetched = fetch_papers_batched(fetch_keys, batch_size, concurrency, base_url)
+        else:
+            fetched = fetch_papers(fetch_keys, concurrency, base_url)
+        for i, paper in enumerate(fetched):
+            if paper is None:
+                continue
+            responses[i] = paper
+            if cache is not None:
+                cache.put([fetch_keys[i]] + response_keys(paper), paper)
+
     valid_dois = []
     api_res = []
-    total_size = len(paper_dois)
-    for i in range(total_size):
-        print("Progress: {0:0.2%}".format(i/total_size))
-        if (paper_dois[i] == ""):
+    for i, temp_response in enumerate(responses):
+        if temp_response is None:
             continue
-        
-        if (len(dataframe.iloc[i].get("paper", "")) > 0):
-            r = requests.get(urlID + dataframe.iloc[i]["paper"])
+
+        found_doi = extract_dois(temp_response.get("doi", ""))
+        if (len(found_doi) > 0):
+            valid_dois.append(found_doi)
+            dataframe.at[i, "doi"] = found_doi
         else:
-            r = requests.get(url + paper_dois[i])
-
-        if (r.status_code == 200):
-            temp_response = json.loads(r.text)
-            found_doi = extract_dois(temp_response.get("doi", ""))
-            if (len(found_doi) > 0):
-                valid_dois.append(found_doi)
-                dataframe.at[i, "doi"] = found_doi
-            else:
-                valid_dois.append(paper_dois[i])
-            api_res.append(temp_response)
+            valid_dois.append(paper_dois[i])
+        api_res.append(temp_response)
 
     return (api_res, valid_dois)
 
@@ -120,14 +421,15 @@ def extract_oa_id(urlID: str):
 def parse_list(key_val: str, row: list):
     if (row.get(key_val, False)):
         if (type(row[key_val]) == str):
-            return eval(row[key_val])
+            return parse_list_cell(row[key_val])
         else:
             return row[key_val]
     else:
         return []
 
 
-def convert_to_json(dataframe: pd.DataFrame, api_res: list, api_dois: list):
+def convert_to_json(dataframe: pd.DataFrame, api_res: list, api_dois: list,
+                    max_abstract_words: int = None):
     """ Creates a list of json objects by merging API data with our own dataframe.
     Args:
         dataframe : pd.DataFrame
@@ -136,21 +438,46 @@ def convert_to_json(dataframe: pd.DataFrame, api_res: list, api_dois: list):
             A list of API papers each in JSON format.
         api_dois : list
             A list of API dois.
+        max_abstract_words : int
+            Optional cap on the length of abstracts rebuilt from API data.
     Returns:
         list
-            List of objects containing our labeled data merged with API data.
+            List of GoldenRecord objects containing our labeled data merged with API data.
+    """
+
+    return list(generate_json_records(dataframe, api_res, api_dois, max_abstract_words))
+
+
+def generate_json_records(dataframe: pd.DataFrame, api_res: list, api_dois: list,
+                          max_abstract_words: int = None):
+    """ Yields json objects one at a time by merging API data with our own dataframe.
+    Args:
+        dataframe : pd.DataFrame
+            Dataframe of our labeled data.
+        api_res : list
+            A list of API papers each in JSON format.
+        api_dois : list
+            A list of API dois.
+        max_abstract_words : int
+            Optional cap on the length of abstracts rebuilt from API data.
+    Returns:
+        generator
+            GoldenRecord objects containing our labeled data merged with API data.
     """
 
-    # Define list for newly formatted data
-    golden_jsons = []
+    api_abstracts = build_abstracts(
+        [api_paper.get("abstract_inverted_index") for api_paper in api_res], max_abstract_words)
+    api_index_by_key = build_api_index(api_res, api_dois)
+    unmatched = []
 
     # Convert dataframe to json format
     for index, row in dataframe.iterrows():
         try:
-            api_index = api_dois.index(
-                row["doi"].upper()) if row["doi"].upper() in api_dois else -1
+            api_index, reason = match_api_paper(row, api_index_by_key)
+            if (api_index < 0):
+                unmatched.append((row["doi"], row["url"], reason))
             api_paper = (api_index >= 0 and api_res[api_index]) or {}
-            temp_dict = {}
+            temp_dict = GoldenRecord()
 
             if (api_index >= 0):
                 temp_dict["paper"] = extract_oa_id(api_paper["id"])
@@ -209,10 +536,7 @@ def convert_to_json(dataframe: pd.DataFrame, api_res: list, api_dois: list):
 
                 # Title + Abstract
                 temp_dict["title"] = api_paper.get("title", "")
-                if (api_paper["abstract_inverted_index"]):
-                    temp_dict["abstract"] = build_abstract(api_paper["abstract_inverted_index"])
-                else:
-                    temp_dict["abstract"] = ""
+                temp_dict["abstract"] = api_abstracts[api_index]
 
                 # Open Access
                 temp_dict["isOpenAccess"] = bool(api_paper["open_access"]["is_oa"])
@@ -240,18 +564,18 @@ def convert_to_json(dataframe: pd.DataFrame, api_res: list, api_dois: list):
             if (len(row["venue_names"]) and row["venue_names"][0] =="["):
                 old_ven_names = []
                 
-                for venue in eval(row["venue_names"]):
+                for venue in parse_list_cell(row["venue_names"]):
                     if venue not in temp_dict["venue_names"]:
                         old_ven_names.append(venue)
                 
                 temp_dict["venue_names"] += old_ven_names
                 
             temp_dict["level1"] = (row["label_level_1"] and clean_labels(
-                eval(row["label_level_1"]))) or []
+                parse_list_cell(row["label_level_1"]))) or []
             temp_dict["level2"] = (row["label_level_2"] and clean_labels(
-                eval(row["label_level_2"]))) or []
+                parse_list_cell(row["label_level_2"]))) or []
             temp_dict["level3"] = (row["label_level_3"] and clean_labels(
-                eval(row["label_level_3"]))) or []
+                parse_list_cell(row["label_level_3"]))) or []
             # temp_dict["ask_level1"] = row.get("ask_label_level_1", [])
             # temp_dict["ask_level2"] = row.get("ask_label_level_2", [])
             # temp_dict["ask_level3"] = row.get("ask_label_level_3", [])
@@ -262,13 +586,80 @@ def convert_to_json(dataframe: pd.DataFrame, api_res: list, api_dois: list):
             temp_dict["relative_relevancy"] = parse_list("relative_relevancy", row)
             temp_dict["mag_terms"] = parse_list("mag_terms", row)
 
-            golden_jsons.append(temp_dict)
+            yield temp_dict
 
         except Exception as error:
             print(traceback.format_exc())
             print(row["doi"])
 
-    return golden_jsons
+    report_unmatched(unmatched)
+
+
+def build_api_index(api_res: list, api_dois: list):
+    """Indexes the API responses by normalized DOI and Open Alex ID, keeping the first response for each.
+    Args:
+        api_res : list
+            A list of API papers each in JSON format.
+        api_dois : list
+            A list of API dois.
+    Returns:
+        dict
+            Maps ("doi", DOI) and ("openalex_id", ID) tuples to positions in api_res.
+    """
+
+    api_index_by_key = {}
+    for api_index, doi in enumerate(api_dois):
+        api_index_by_key.setdefault(("doi", doi.upper()), api_index)
+    for api_index, api_paper in enumerate(api_res):
+        oa_id = extract_oa_id(api_paper.get("id"))
+        if oa_id:
+            api_index_by_key.setdefault(("openalex_id", oa_id.upper()), api_index)
+    return api_index_by_key
+
+
+def match_api_paper(row: pd.Series, api_index_by_key: dict):
+    """Finds the API response for a row of our labeled data, first by DOI and then by Open Alex ID.
+    Args:
+        row : pd.Series
+            A row of our labeled data.
+        api_index_by_key : dict
+            Index built by build_api_index.
+    Returns:
+        Tuple
+            int
+                Position of the matching API paper, or -1 if there is none.
+            str
+                Why no match was found, or an empty string.
+    """
+
+    doi = row["doi"].upper()
+    oa_id = str(row.get("paper", "") or "").upper()
+    if doi and ("doi", doi) in api_index_by_key:
+        return (api_index_by_key[("doi", doi)], "")
+    if oa_id and ("openalex_id", oa_id) in api_index_by_key:
+        return (api_index_by_key[("openalex_id", oa_id)], "")
+    if not doi and not oa_id:
+        return (-1, "no DOI or Open Alex ID")
+    return (-1, "not returned by Open Alex")
+
+
+def report_unmatched(unmatched: list):
+    """Prints the rows that could not be joined with API data, grouped by reason.
+    Args:
+        unmatched : list
+            (doi, url, reason) tuples.
+    """
+
+    if not unmatched:
+        return
+    reasons = {}
+    for doi, url, reason in unmatched:
+        reasons.setdefault(reason, []).append(doi or url)
+    print("Rows without API data: {}".format(len(unmatched)))
+    for reason, papers in reasons.items():
+        print("  {}: {}".format(reason, len(papers)))
+        for paper in papers:
+            print("    {}".format(paper))
 
 def clean_labels(labels: list):
     """Reformats labels into more model friendly formats.
@@ -293,27 +684,39 @@ def extract_dois(doi: str):
 
 if __name__ == "__main__":
     args = get_arg_parser()
-    dataframe = pd.read_csv(args.csv_path, encoding="utf8")
-    dataframe = dataframe.dropna(subset="url").fillna("")
-    dataframe = dataframe.sort_values("petalID", axis=0, ascending=True)
-    dataframe["doi"] = dataframe["doi"] \
-        .apply(extract_dois)
-    (api_res, api_dois) = get_api_data(dataframe)
-    golden_jsons = convert_to_json(dataframe, api_res, api_dois)
-    
-    if not os.path.isdir("../FinalFile"):
-        os.system("mkdir ../FinalFile")
-        
-    # Write json data to a json file
-    with open(f"{args.output_name}.json", "w") as golden_file:
-        golden_file.write("[\n")
-        golden_size = len(golden_jsons)
-
-        for index in range(golden_size):
-            golden_file.write("\t")
-            golden_file.write(json.dumps(golden_jsons[index]))
-
-            if(index < golden_size - 1):
-                golden_file.write(",\n")
-
-        golden_file.write("\n]")
+    with StageMetrics("convert") as metrics:
+        metrics.track_client(client)
+        dataframe = pd.read_csv(args.csv_path, encoding="utf8")
+        dataframe = dataframe.dropna(subset="url").fillna("")
+        dataframe = dataframe.sort_values("petalID", axis=0, ascending=True)
+        dataframe["doi"] = dataframe["doi"] \
+            .apply(extract_dois)
+        cache = None
+        if args.cache:
+            days = 24 * 60 * 60
+            cache = OpenAlexCache(
+                args.cache,
+                ttl=args.cache_ttl and args.cache_ttl * days,
+                max_entries=args.cache_max_entries,
+                refresh_older_than=args.refresh_older_than and args.refresh_older_than * days)
+            metrics.track_cache(cache)
+        try:
+            (api_res, api_dois) = get_api_data(
+                dataframe, args.concurrency, batch_size=args.batch_size,
+                cache=cache, cache_only=args.cache_only)
+        finally:
+            if cache is not None:
+                cache.close()
+                cache.report()
+        metrics.add("api_papers", len(api_res))
+        golden_jsons = generate_json_records(
+            dataframe, api_res, api_dois, args.max_abstract_words)
+
+        if not os.path.isdir("../FinalFile"):
+            os.system("mkdir ../FinalFile")
+
+        # Write json data to a json file as it is produced
+        metrics.rows = json_stream.write_records(
+            f"{args.output_name}.json",
+            (record.to_dict() for record in golden_jsons),
+            args.json_array)
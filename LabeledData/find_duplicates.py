@@ -0,0 +1,226 @@
+import argparse
+import json
+import os
+import re
+import sys
+import unicodedata
+import zlib
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Utils"))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Update"))
+import json_stream
+from stage_metrics import StageMetrics
+from golden_cache import GoldenCache, RAW_NAME
+
+GOLDEN_URL = "https://raw.githubusercontent.com/nasa-petal/data-collection-and-prep/main/golden.json"
+SHINGLE_SIZE = 3
+NUM_PERM = 128
+BANDS = 32
+# Prime just above 2**32, so hashed shingles are below it and a * x fits in 64 bits
+PRIME = 4294967311
+SEED = 1
+
+
+def get_arg_parser():
+    """Allows arguments to be passed into this program through the terminal.
+    Returns:
+        argparse.Namespace: Object containing selected options
+    """
+
+    def dir_path(string):
+        if os.path.isfile(string):
+            return string
+        else:
+            raise NotADirectoryError(string)
+
+    parser = argparse.ArgumentParser(description="Flag papers that are likely duplicates of each other or of the golden dataset")
+    parser.add_argument(
+        "csv_path", help="Full path to CSV labeled file", type=dir_path)
+    parser.add_argument("output_name", help="Name of the report file", type=str)
+    parser.add_argument("--golden", help="Path or URL of the golden JSON file, or an empty string to skip it",
+                        type=str, default=GOLDEN_URL)
+    parser.add_argument("--golden-cache", help="Directory used to cache a remote golden file between runs",
+                        type=str, default=".golden_cache")
+    parser.add_argument("--threshold", help="Estimated Jaccard similarity at which two papers are reported",
+                        type=float, default=0.7)
+    return parser.parse_args()
+
+
+def normalize_text(text):
+    """Lowercases text, strips accents and punctuation and splits it into words."""
+
+    if not isinstance(text, str):
+        return []
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(character for character in text if not unicodedata.combining(character))
+    return re.findall(r"[a-z0-9]+", text.lower())
+
+
+def shingle(title, abstract):
+    """Builds the set of hashed word shingles of a paper's title and abstract.
+    Args:
+        title : str
+            Title of the paper.
+        abstract : str
+            Abstract of the paper.
+    Returns:
+        np.ndarray
+            Unique 32 bit shingle hashes; empty if the paper has no text.
+    """
+
+    words = normalize_text(title) + normalize_text(abstract)
+    if len(words) < SHINGLE_SIZE:
+        shingles = words
+    else:
+        shingles = [" ".join(words[start:start + SHINGLE_SIZE]) for start in range(len(words) - SHINGLE_SIZE + 1)]
+    return np.unique(np.array([zlib.crc32(text.encode("utf8")) for text in shingles], dtype=np.uint64))
+
+
+class MinHasher:
+    """Computes MinHash signatures with NUM_PERM universal hash functions (a * x + b) mod PRIME."""
+
+    def __init__(self, num_perm: int = NUM_PERM, seed: int = SEED):
+        generator = np.random.default_rng(seed)
+        self.a = generator.integers(1, 2**32, size=(num_perm, 1), dtype=np.uint64)
+        self.b = generator.integers(0, 2**32, size=(num_perm, 1), dtype=np.uint64)
+
+    def signature(self, shingles: np.ndarray):
+        values = (self.a * shingles[np.newaxis, :] % PRIME + self.b) % PRIME
+        return values.min(axis=1).astype(np.uint32)
+
+
+class LSHIndex:
+    """Buckets MinHash signatures band by band so that only papers sharing a band are compared.
+    Args:
+        bands : int
+            Number of bands each signature is cut into; NUM_PERM must be a multiple of it.
+    """
+
+    def __init__(self, bands: int = BANDS):
+        self.bands = bands
+        self.buckets = {}
+
+    def add(self, key, signature: np.ndarray):
+        for band, values in enumerate(np.split(signature, self.bands)):
+            self.buckets.setdefault((band, values.tobytes()), []).append(key)
+
+    def candidate_pairs(self):
+        """Yields every pair of keys that share at least one bucket, once."""
+
+        seen = set()
+        for keys in self.buckets.values():
+            for first in range(len(keys)):
+                for second in range(first + 1, len(keys)):
+                    pair = (keys[first], keys[second])
+                    if pair not in seen:
+                        seen.add(pair)
+                        yield pair
+
+
+def find_clusters(pairs: list):
+    """Groups pairs of keys into connected clusters with union-find."""
+
+    parents = {}
+
+    def find(key):
+        parents.setdefault(key, key)
+        while parents[key] != key:
+            parents[key] = parents[parents[key]]
+            key = parents[key]
+        return key
+
+    for first, second in pairs:
+        parents[find(first)] = find(second)
+    clusters = {}
+    for key in parents:
+        clusters.setdefault(find(key), []).append(key)
+    return sorted(sorted(cluster) for cluster in clusters.values())
+
+
+def find_duplicates(papers: pd.DataFrame, golden: pd.DataFrame, threshold: float):
+    """Finds clusters of papers whose titles and abstracts are near duplicates, in sub-quadratic time.
+    Every cluster contains at least one new paper; duplicates within the golden dataset are not reported.
+    Args:
+        papers : pd.DataFrame
+            The combined labeled papers, with title and abstract columns.
+        golden : pd.DataFrame
+            Title and abstract of the golden papers, or an empty DataFrame.
+        threshold : float
+            Estimated Jaccard similarity at which two papers count as duplicates.
+    Returns:
+        list
+            Clusters, each a list of ("new", row) and ("golden", row) keys.
+    """
+
+    hasher = MinHasher()
+    index = LSHIndex()
+    signatures = {}
+    for source, frame in (("new", papers), ("golden", golden)):
+        titles = frame["title"].tolist() if "title" in frame.columns else [None] * frame.shape[0]
+        abstracts = frame["abstract"].tolist() if "abstract" in frame.columns else [None] * frame.shape[0]
+        for row, (title, abstract) in enumerate(zip(titles, abstracts)):
+            shingles = shingle(title, abstract)
+            if not len(shingles):
+                continue
+            key = (source, row)
+            signatures[key] = hasher.signature(shingles)
+            index.add(key, signatures[key])
+
+    pairs = []
+    for first, second in index.candidate_pairs():
+        if first[0] == "golden" and second[0] == "golden":
+            continue
+        if np.mean(signatures[first] == signatures[second]) >= threshold:
+            pairs.append((first, second))
+    return find_clusters(pairs)
+
+
+def load_golden(path: str, cache_dir: str):
+    """Reads the title, abstract and identifiers of every golden paper from a local file or URL."""
+
+    if not path:
+        return pd.DataFrame()
+    if path.startswith("https://"):
+        golden_cache = GoldenCache(cache_dir)
+        golden_cache.download(path)
+        path = golden_cache.path(RAW_NAME)
+    fields = ("petalID", "doi", "url", "title", "abstract")
+    return pd.DataFrame([{field: record.get(field) for field in fields}
+                         for record in json_stream.read_records(path)])
+
+
+def describe(key: tuple, papers: pd.DataFrame, golden: pd.DataFrame):
+    source, row = key
+    paper = (papers if source == "new" else golden).iloc[row]
+    member = {"source": source}
+    if source == "new":
+        member["row"] = row
+    else:
+        petalID = paper.get("petalID")
+        member["petalID"] = int(petalID) if pd.notna(petalID) else ""
+    for field in ("doi", "url", "title"):
+        value = paper.get(field)
+        member[field] = "" if pd.isna(value) else value
+    return member
+
+
+if __name__ == "__main__":
+    args = get_arg_parser()
+    with StageMetrics("dedup") as metrics:
+        papers = pd.read_csv(args.csv_path, encoding="utf8")
+        golden = load_golden(args.golden, args.golden_cache)
+        clusters = find_duplicates(papers, golden, args.threshold)
+
+        report = [[describe(key, papers, golden) for key in cluster] for cluster in clusters]
+        with open(args.output_name + ".json", "w") as report_file:
+            json.dump({"threshold": args.threshold, "clusters": report}, report_file, indent=4)
+
+        with_golden = sum(any(member["source"] == "golden" for member in cluster) for cluster in report)
+        print("Candidate duplicate clusters: {} ({} include golden papers)".format(len(report), with_golden))
+        metrics.rows = papers.shape[0]
+        metrics.add("golden_rows", golden.shape[0])
+        metrics.add("clusters", len(report))
+        metrics.add("clusters_with_golden", with_golden)
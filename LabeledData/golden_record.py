@@ -0,0 +1,69 @@
+import pandas as pd
+
+# Golden schema fields in the order they are written out
+GOLDEN_FIELDS = (
+    "paper", "mesh_terms", "venue_ids", "venue_names", "author_ids", "author_names",
+    "reference_ids", "title", "abstract", "isOpenAccess", "fullDocLink", "petalID", "doi",
+    "level1", "level2", "level3", "isBiomimicry", "url", "species", "absolute_relevancy",
+    "relative_relevancy", "mag_terms"
+)
+
+
+class GoldenRecord:
+    """A single paper in the golden schema, stored in slots rather than a per-paper dict.
+    Fields can be set either as attributes or with record["field"] = value; fields never set are left out of to_dict().
+    """
+
+    __slots__ = GOLDEN_FIELDS
+
+    def __init__(self, **fields):
+        for key, value in fields.items():
+            setattr(self, key, value)
+
+    def __getitem__(self, key: str):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __setitem__(self, key: str, value):
+        try:
+            setattr(self, key, value)
+        except AttributeError:
+            raise KeyError("{} is not a golden field".format(key)) from None
+
+    def __contains__(self, key: str):
+        return key in GOLDEN_FIELDS and hasattr(self, key)
+
+    def __eq__(self, other):
+        return isinstance(other, GoldenRecord) and self.to_dict() == other.to_dict()
+
+    def __repr__(self):
+        return "GoldenRecord({})".format(self.to_dict())
+
+    def to_dict(self):
+        """Converts the record into a JSON serializable dict.
+        Returns:
+            dict
+                Every field that has been set, in golden schema order.
+        """
+
+        return {field: getattr(self, field) for field in GOLDEN_FIELDS if hasattr(self, field)}
+
+    @staticmethod
+    def to_dataframe(records: list):
+        """Builds a DataFrame straight from records, one column per field that any record sets.
+        Args:
+            records : list
+                List of GoldenRecord objects.
+        Returns:
+            pd.DataFrame
+                One row per record, with None where a record leaves a field unset.
+        """
+
+        columns = {}
+        for field in GOLDEN_FIELDS:
+            column = [getattr(record, field, None) for record in records]
+            if any(hasattr(record, field) for record in records):
+                columns[field] = column
+        return pd.DataFrame(columns)
@@ -0,0 +1,120 @@
+import json
+import sqlite3
+import time
+
+
+class OpenAlexCache:
+    """SQLite backed store of raw Open Alex responses keyed by normalized DOI and Open Alex ID.
+    Args:
+        path : str
+            Path + filename of the SQLite database.
+        ttl : float
+            Age in seconds after which entries are evicted, or None to keep them forever.
+        max_entries : int
+            Maximum number of keys kept, oldest first to go, or None for no limit.
+        refresh_older_than : float
+            Age in seconds after which entries are treated as misses and fetched again.
+    """
+
+    def __init__(self, path: str, ttl: float = None, max_entries: int = None,
+                 refresh_older_than: float = None):
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS papers ("
+            "key TEXT PRIMARY KEY, response TEXT NOT NULL, fetched_at REAL NOT NULL)")
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS papers_fetched_at ON papers (fetched_at)")
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.refresh_older_than = refresh_older_than
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+
+    @staticmethod
+    def make_key(key: tuple):
+        """Normalizes a (filter name, value) request key into a cache key.
+        Args:
+            key : tuple
+                A (filter name, value) tuple such as ("doi", "10.1234/abc").
+        Returns:
+            str
+                The cache key.
+        """
+
+        return "{}:{}".format(key[0], key[1].strip().upper())
+
+    def get(self, key: tuple, allow_stale: bool = False):
+        """Looks up a cached response, counting the hit or miss.
+        Args:
+            key : tuple
+                A (filter name, value) request key.
+            allow_stale : bool
+                Return stale entries too, counted as stale hits, for when they cannot be refreshed.
+        Returns:
+            dict
+                The cached paper in a JSON format, or None if missing or stale.
+        """
+
+        row = self.connection.execute(
+            "SELECT response, fetched_at FROM papers WHERE key = ?",
+            (self.make_key(key),)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        if self.is_stale(row[1]):
+            if not allow_stale:
+                self.misses += 1
+                return None
+            self.stale_hits += 1
+        else:
+            self.hits += 1
+        return json.loads(row[0])
+
+    def is_stale(self, fetched_at: float):
+        now = time.time()
+        if self.ttl is not None and now - fetched_at > self.ttl:
+            return True
+        if self.refresh_older_than is not None and now - fetched_at > self.refresh_older_than:
+            return True
+        return False
+
+    def put(self, keys: list, response: dict):
+        """Stores a response under each of the given request keys.
+        Args:
+            keys : list
+                Request keys the response should be found under.
+            response : dict
+                The paper in a JSON format.
+        """
+
+        text = json.dumps(response)
+        fetched_at = time.time()
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO papers (key, response, fetched_at) VALUES (?, ?, ?)",
+            [(self.make_key(key), text, fetched_at) for key in keys])
+
+    def evict(self):
+        """Removes expired entries, then the oldest entries above max_entries."""
+
+        if self.ttl is not None:
+            self.connection.execute(
+                "DELETE FROM papers WHERE fetched_at < ?", (time.time() - self.ttl,))
+        if self.max_entries is not None:
+            self.connection.execute(
+                "DELETE FROM papers WHERE key IN ("
+                "SELECT key FROM papers ORDER BY fetched_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,))
+
+    def close(self):
+        self.evict()
+        self.connection.commit()
+        self.connection.close()
+
+    def report(self):
+        total = self.hits + self.misses
+        rate = self.hits / total if total else 0
+        print("Cache hits: {} | Cache misses: {} | Hit rate: {:0.2%}".format(
+            self.hits, self.misses, rate))
+        if self.stale_hits:
+            print("Stale entries used without refreshing: {}".format(self.stale_hits))
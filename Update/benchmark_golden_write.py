@@ -0,0 +1,68 @@
+"""Compares writing the golden dataset row by row through iterrows() with the column-wise writer in json_stream.
+
+Usage: python benchmark_golden_write.py [number_of_records]
+"""
+import filecmp
+import json
+import os
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Utils"))
+import json_stream
+
+
+def make_golden(count: int):
+    """Builds a synthetic golden DataFrame shaped like the output of merge_data."""
+
+    return pd.DataFrame({
+        "paper": ["W{}".format(index) for index in range(count)],
+        "mesh_terms": [["Term {}".format(index), "Térm"] for index in range(count)],
+        "author_ids": [["A{}".format(index), "A{}".format(index + 1)] for index in range(count)],
+        "title": ["Title of paper {}".format(index) for index in range(count)],
+        "abstract": ["Abstract of paper {}: \"quoted\", with a comma".format(index) * 20 for index in range(count)],
+        "isOpenAccess": [bool(index % 2) if index % 3 else "" for index in range(count)],
+        "petalID": range(1, count + 1),
+        "doi": ["10.1234/PAPER.{}".format(index) for index in range(count)],
+        "level1": [["protect from harm"] for index in range(count)],
+        "absolute_relevancy": [[0.5, 1e-05, index / 7] for index in range(count)],
+    })
+
+
+def write_iterrows(path: str, golden: pd.DataFrame):
+    """The writer update_golden.py used before, one row.to_dict() and json.dumps per row."""
+
+    with open(path, "w") as golden_file:
+        golden_file.write("[\n")
+        for index, row in golden.iterrows():
+            golden_file.write("\t")
+            golden_file.write(json.dumps(row.to_dict()))
+            if index != golden.shape[0] - 1:
+                golden_file.write(",\n")
+        golden_file.write("\n]")
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    golden = make_golden(count)
+    with tempfile.TemporaryDirectory() as directory:
+        old_path = os.path.join(directory, "iterrows.json")
+        new_path = os.path.join(directory, "frame.json")
+        old_time = timed(write_iterrows, old_path, golden)
+        new_time = timed(json_stream.write_frame, new_path, golden, True)
+        identical = filecmp.cmp(old_path, new_path, shallow=False)
+
+    print("Records: {}".format(count))
+    print("iterrows:    {:8.2f} s".format(old_time))
+    print("write_frame: {:8.2f} s".format(new_time))
+    print("Speedup:     {:8.1f}x".format(old_time / new_time))
+    print("Identical:   {}".format(identical))
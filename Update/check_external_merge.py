@@ -0,0 +1,121 @@
+"""Checks that the out-of-core merge behind --max-memory produces the same golden and delta as the in-memory merge.
+The new records mix matching petalIDs, empty petalIDs and no petalID at all, matched by DOI, Open Alex ID or URL,
+with records that change nothing, records that change something and records that are new.
+Merging an empty batch of new records must give the golden back unchanged.
+
+Usage: python check_external_merge.py [number_of_records]
+"""
+import json
+import os
+import sys
+import tempfile
+
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Utils"))
+import json_stream
+import golden_delta
+import golden_external
+from update_golden import merge_records
+
+
+def make_inputs(count: int):
+    """Builds a synthetic golden and a batch of new records that touches every way a record can be matched."""
+
+    golden = [{
+        "petalID": index,
+        "doi": "10.1234/PAPER.{}".format(index),
+        "paper": "W{}".format(index),
+        "url": "https://www.example.org/paper/{}".format(index),
+        "title": "Title of paper {}".format(index),
+        "level1": ["protect from harm"]
+    } for index in range(1, count + 1)]
+
+    new = []
+    for index in range(1, count + 1):
+        record = dict(golden[index - 1])
+        if index % 3 == 0:
+            record["title"] = "Revised title of paper {}".format(index)
+        match = index % 4
+        if match == 1:
+            record["petalID"] = ""
+        elif match == 2:
+            del record["petalID"]
+            if index % 5 == 0:
+                # A resubmission carrying only its DOI and title must not blank the other fields
+                record = {"doi": record["doi"], "title": record["title"]}
+        elif match == 3:
+            del record["petalID"]
+            record["doi"] = ""
+            record["paper"] = "https://openalex.org/W{}".format(index)
+        new.append(record)
+    for index in range(count // 5):
+        new.append({"doi": "10.9999/NEW.{}".format(index), "title": "New paper {}".format(index),
+                    "level1": ["sense signals"]})
+    return golden, new
+
+
+def merge_in_memory(golden_path: str, new_path: str):
+    """Merges the way update_golden.py does without --max-memory and returns the records and delta."""
+
+    golden = pd.read_json(golden_path, precise_float=True)
+    new_file = pd.DataFrame(json_stream.read_records(new_path))
+    golden_hashes = golden_delta.frame_hashes(golden)
+    merged = merge_records(new_file, golden, golden_hashes)
+    new_records = list(json_stream.frame_records(merged["golden"]))
+    delta = golden_delta.compute_delta(golden.to_dict("records"), new_records, golden_hashes, merged["hashes"])
+    return merged, json.loads(json.dumps(new_records)), json.loads(json.dumps(delta))
+
+
+def check_empty(golden: list, directory: str):
+    """Checks that merging no new records, as NDJSON or as an empty array, gives the golden back with 0/0/0 counts."""
+
+    golden_path = os.path.join(directory, "golden.json")
+    for layout, text in (("ndjson", ""), ("array", "[\n\n]")):
+        new_path = os.path.join(directory, "empty_{}.json".format(layout))
+        with open(new_path, "w") as new_file:
+            new_file.write(text)
+        output_name = os.path.join(directory, "empty_golden_{}".format(layout))
+        in_memory, memory_records, memory_delta = merge_in_memory(golden_path, new_path)
+        external = golden_external.external_merge(golden_path, new_path, output_name, 1 << 16, True)
+        for merged in (in_memory, external):
+            if (merged["added"], merged["changed"], merged["unchanged"]) != (0, 0, 0):
+                return False
+        if memory_records != golden or list(json_stream.read_records(output_name + ".json")) != golden:
+            return False
+        if memory_delta["modified"] or memory_delta["added"] or external["modified"]:
+            return False
+    return True
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    golden, new = make_inputs(count)
+    with tempfile.TemporaryDirectory() as directory:
+        golden_path = os.path.join(directory, "golden.json")
+        new_path = os.path.join(directory, "new_data.json")
+        output_name = os.path.join(directory, "new_golden")
+        json_stream.write_records(golden_path, golden, True)
+        json_stream.write_records(new_path, new, False)
+
+        in_memory, memory_records, memory_delta = merge_in_memory(golden_path, new_path)
+        external = golden_external.external_merge(golden_path, new_path, output_name, 1 << 16, True)
+        external_records = list(json_stream.read_records(output_name + ".json"))
+        external_delta = golden_delta.read_delta(output_name + ".delta.json")
+        empty = check_empty(golden, directory)
+
+    checks = {
+        "records": memory_records == external_records,
+        "delta": memory_delta == external_delta,
+        "modified": len(memory_delta["modified"]) == external["modified"],
+        "counts": all(in_memory[name] == external[name] for name in ("added", "changed", "unchanged")),
+        "matches": in_memory["matches"] == external["matches"],
+        "empty": empty,
+        "kept": all(record["paper"] and record["url"] for record in memory_records[:len(golden)])
+    }
+    print("Records:  {} golden, {} new".format(len(golden), len(new)))
+    print("Added {}, changed {}, modified {}, unchanged {}".format(
+        external["added"], external["changed"], external["modified"], external["unchanged"]))
+    for name, passed in checks.items():
+        print("{:9} {}".format(name + ":", "ok" if passed else "FAILED"))
+    sys.exit(0 if all(checks.values()) else 1)
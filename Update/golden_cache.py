@@ -0,0 +1,119 @@
+import hashlib
+import io
+import json
+import os
+import sys
+
+import pandas as pd
+import requests
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Utils"))
+from http_client import HttpClient
+
+RAW_NAME = "golden.json"
+PARSED_NAME = "golden.pkl"
+META_NAME = "meta.json"
+
+
+class GoldenCache:
+    """Local copy of the remote golden dataset, revalidated with conditional GET requests.
+    The raw file is kept with its ETag, Last-Modified and SHA-256, next to a pickled DataFrame so an unchanged golden never has to be parsed again.
+    Args:
+        cache_dir : str
+            Directory holding the cached files.
+        client : HttpClient
+            Client used for the requests; a new one is made if not given.
+    """
+
+    def __init__(self, cache_dir: str, client: HttpClient = None):
+        self.cache_dir = cache_dir
+        self.client = client or HttpClient()
+        self.status = None
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def path(self, name: str):
+        return os.path.join(self.cache_dir, name)
+
+    def read_meta(self):
+        if not os.path.isfile(self.path(META_NAME)):
+            return {}
+        with open(self.path(META_NAME), encoding="utf8") as meta_file:
+            return json.load(meta_file)
+
+    def write_meta(self, meta: dict):
+        with open(self.path(META_NAME), "w") as meta_file:
+            json.dump(meta, meta_file, indent=4)
+
+    def load_parsed(self, meta: dict):
+        """Loads the pickled DataFrame if it was built from the cached raw file, otherwise parses the raw file again."""
+
+        if meta.get("parsed_sha256") == meta.get("sha256") and os.path.isfile(self.path(PARSED_NAME)):
+            return pd.read_pickle(self.path(PARSED_NAME))
+        with open(self.path(RAW_NAME), "rb") as raw_file:
+            golden = pd.read_json(io.StringIO(raw_file.read().decode("utf8")), precise_float=True)
+        golden.to_pickle(self.path(PARSED_NAME))
+        meta["parsed_sha256"] = meta["sha256"]
+        self.write_meta(meta)
+        return golden
+
+    def download(self, url: str):
+        """Makes sure the cached raw file holds the current golden dataset at url, downloading it only when it has changed.
+        Args:
+            url : str
+                URL of the golden JSON file.
+        Returns:
+            dict
+                The cache metadata; the raw file is at path(RAW_NAME).
+        """
+
+        meta = self.read_meta()
+        cached = meta.get("url") == url and os.path.isfile(self.path(RAW_NAME))
+        headers = {}
+        if cached and meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if cached and meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+        try:
+            response = self.client.get(url, headers=headers)
+        except requests.RequestException as error:
+            if not cached:
+                raise
+            print("Could not revalidate cached golden ({}), using the cached copy".format(error))
+            self.status = "stale"
+            return meta
+
+        if response.status_code == 304 and cached:
+            self.status = "not modified"
+            return meta
+        response.raise_for_status()
+
+        content = response.content
+        sha256 = hashlib.sha256(content).hexdigest()
+        unchanged = cached and sha256 == meta.get("sha256")
+        meta.update({
+            "url": url,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "sha256": sha256
+        })
+        if unchanged:
+            self.status = "unchanged"
+        else:
+            self.status = "downloaded"
+            with open(self.path(RAW_NAME), "wb") as raw_file:
+                raw_file.write(content)
+        self.write_meta(meta)
+        return meta
+
+    def load(self, url: str):
+        """Returns the golden dataset at url as a DataFrame, downloading and parsing it only when it has changed.
+        Args:
+            url : str
+                URL of the golden JSON file.
+        Returns:
+            pd.DataFrame
+                The golden dataset.
+        """
+
+        return self.load_parsed(self.download(url))
@@ -0,0 +1,278 @@
+import argparse
+import datetime
+import hashlib
+import json
+import math
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Utils"))
+import json_stream
+
+
+def get_arg_parser():
+    """Allows arguments to be passed into this program through the terminal.
+    Returns:
+        argparse.Namespace: Object containing selected options
+    """
+
+    parser = argparse.ArgumentParser(description="Apply a chain of golden delta files to a base snapshot")
+    parser.add_argument("base_path", help="Full path to the base golden JSON file", type=str)
+    parser.add_argument("delta_paths", help="Delta files to apply, oldest first", type=str, nargs="+")
+    parser.add_argument("output_name", help="Name of output file", type=str)
+    parser.add_argument("--no-verify", help="Skip checking the base and result hashes recorded in each delta",
+                        action="store_true")
+    parser.add_argument("--json-array", help="Write a bracketed JSON array instead of newline-delimited JSON",
+                        action="store_true")
+    return parser.parse_args()
+
+
+def normalize_record(record: dict):
+    """Drops empty and missing values so that a missing field and an empty one compare equal, and writes whole floats as ints.
+    Args:
+        record : dict
+            A golden record.
+    Returns:
+        dict
+            The record without "", None or NaN values.
+    """
+
+    normalized = {}
+    for key, value in record.items():
+        if value is None or (isinstance(value, str) and value == ""):
+            continue
+        if isinstance(value, float):
+            if math.isnan(value):
+                continue
+            # pandas turns integer columns with gaps into floats
+            if value.is_integer():
+                value = int(value)
+        normalized[key] = value
+    return normalized
+
+
+def record_hash(record: dict):
+    """Computes a stable content hash for a golden record, independent of key order.
+    Args:
+        record : dict
+            A golden record.
+    Returns:
+        str
+            Hex SHA-256 of the normalized record.
+    """
+
+    canonical = json.dumps(normalize_record(record), sort_keys=True, default=str)
+    return hashlib.sha256(canonical.encode("utf8")).hexdigest()
+
+
+def frame_hashes(frame):
+    """Computes the content hash of every row of a golden DataFrame, in row order.
+    Args:
+        frame : pd.DataFrame
+            DataFrame containing golden records.
+    Returns:
+        list
+            Hex SHA-256 of each normalized record.
+    """
+
+    return [record_hash(record) for record in json_stream.frame_records(frame)]
+
+
+def dataset_hash(record_hashes: list):
+    """Combines the hashes of every record, in order, into one hash for the whole dataset."""
+
+    digest = hashlib.sha256()
+    for hash_value in record_hashes:
+        digest.update(hash_value.encode("ascii"))
+    return digest.hexdigest()
+
+
+def file_hash(path: str):
+    digest = hashlib.sha256()
+    with open(path, "rb") as hashed_file:
+        for block in iter(lambda: hashed_file.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def compute_delta(base_records: list, new_records: list, base_hashes: list = None, new_hashes: list = None):
+    """Works out which petalIDs were added, modified or removed between two versions of the golden dataset.
+    Args:
+        base_records : list
+            Records of the golden dataset before the update.
+        new_records : list
+            Records of the golden dataset after the update.
+        base_hashes : list
+            Record hashes of base_records if already known, computed otherwise.
+        new_hashes : list
+            Record hashes of new_records if already known, computed otherwise.
+    Returns:
+        dict
+            The delta, holding the full new values of added and modified records and the removed petalIDs.
+    """
+
+    if base_hashes is None:
+        base_hashes = [record_hash(record) for record in base_records]
+    if new_hashes is None:
+        new_hashes = [record_hash(record) for record in new_records]
+    base_by_id = {record["petalID"]: hash_value
+                  for record, hash_value in zip(base_records, base_hashes)}
+    new_ids = set()
+
+    added = []
+    modified = []
+    for record, hash_value in zip(new_records, new_hashes):
+        new_ids.add(record["petalID"])
+        if record["petalID"] not in base_by_id:
+            added.append(record)
+        elif base_by_id[record["petalID"]] != hash_value:
+            modified.append(record)
+    removed = [petalID for petalID in base_by_id if petalID not in new_ids]
+
+    return {
+        "base_hash": dataset_hash(base_hashes),
+        "result_hash": dataset_hash(new_hashes),
+        "added": added,
+        "modified": modified,
+        "removed": removed
+    }
+
+
+def apply_delta(records: list, delta: dict, verify: bool = True):
+    """Applies one delta to a list of golden records.
+    Args:
+        records : list
+            Records of the snapshot the delta was computed against.
+        delta : dict
+            A delta produced by compute_delta.
+        verify : bool
+            Check the snapshot and the result against the hashes recorded in the delta.
+    Returns:
+        list
+            The updated records; modified records keep their position and added ones go at the end.
+    Raises:
+        ValueError
+            If verification is on and either hash does not match.
+    """
+
+    if verify and dataset_hash([record_hash(record) for record in records]) != delta["base_hash"]:
+        raise ValueError("Delta was computed against a different base snapshot")
+
+    removed = set(delta["removed"])
+    modified = {record["petalID"]: record for record in delta["modified"]}
+    result = [modified.get(record["petalID"], record) for record in records
+              if record["petalID"] not in removed]
+    result.extend(delta["added"])
+
+    if verify and dataset_hash([record_hash(record) for record in result]) != delta["result_hash"]:
+        raise ValueError("Applying the delta did not reproduce the recorded result")
+    return result
+
+
+def write_delta(path: str, delta: dict):
+    with open(path, "w") as delta_file:
+        json.dump(delta, delta_file)
+
+
+def read_delta(path: str):
+    with open(path, encoding="utf8") as delta_file:
+        return json.load(delta_file)
+
+
+def write_fingerprints(path: str, golden_path: str, record_hashes: list):
+    """Stores the record hashes of a golden file next to it, tied to the file's SHA-256.
+    Args:
+        path : str
+            Path + filename of the fingerprints file.
+        golden_path : str
+            Path + filename of the golden file the hashes were computed for.
+        record_hashes : list
+            Hash of every golden record, in file order.
+    """
+
+    with open(path, "w") as fingerprints_file:
+        json.dump({"golden_sha256": file_hash(golden_path), "hashes": record_hashes}, fingerprints_file)
+
+
+def read_fingerprints(path: str, golden_sha256: str, records: int):
+    """Loads stored record hashes if they were computed for the given golden file.
+    Args:
+        path : str
+            Path + filename of the fingerprints file.
+        golden_sha256 : str
+            SHA-256 of the golden file about to be merged into.
+        records : int
+            Number of records in that golden file.
+    Returns:
+        list
+            The record hashes, or None if there are none or they belong to another version of the golden file.
+    """
+
+    if not os.path.isfile(path):
+        return None
+    with open(path, encoding="utf8") as fingerprints_file:
+        fingerprints = json.load(fingerprints_file)
+    if fingerprints.get("golden_sha256") != golden_sha256 or len(fingerprints.get("hashes", [])) != records:
+        return None
+    return fingerprints["hashes"]
+
+
+def summarize_delta(delta: dict):
+    """Reduces a delta to its hashes and the number of added, modified and removed records."""
+
+    return {
+        "base_hash": delta["base_hash"],
+        "result_hash": delta["result_hash"],
+        "added": len(delta["added"]),
+        "modified": len(delta["modified"]),
+        "removed": len(delta["removed"])
+    }
+
+
+def write_manifest(path: str, golden_path: str, delta_path: str, summary: dict, source: str):
+    """Writes a manifest describing a golden snapshot and the delta that produced it.
+    Args:
+        path : str
+            Path + filename of the manifest.
+        golden_path : str
+            Path + filename of the new golden file.
+        delta_path : str
+            Path + filename of the delta file.
+        summary : dict
+            Summary of the delta written to delta_path, as given by summarize_delta.
+        source : str
+            Where the base golden dataset was read from.
+    """
+
+    manifest = {
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "base": {
+            "source": source,
+            "dataset_hash": summary["base_hash"]
+        },
+        "golden": {
+            "path": os.path.basename(golden_path),
+            "sha256": file_hash(golden_path),
+            "dataset_hash": summary["result_hash"]
+        },
+        "delta": {
+            "path": os.path.basename(delta_path),
+            "sha256": file_hash(delta_path),
+            "added": summary["added"],
+            "modified": summary["modified"],
+            "removed": summary["removed"]
+        }
+    }
+    with open(path, "w") as manifest_file:
+        json.dump(manifest, manifest_file, indent=4)
+
+
+if __name__ == "__main__":
+    args = get_arg_parser()
+    records = list(json_stream.read_records(args.base_path))
+    for delta_path in args.delta_paths:
+        delta = read_delta(delta_path)
+        records = apply_delta(records, delta, verify=not args.no_verify)
+        print("Applied {}: {} added, {} modified, {} removed".format(
+            delta_path, len(delta["added"]), len(delta["modified"]), len(delta["removed"])))
+    json_stream.write_records(f"{args.output_name}.json", records, args.json_array)
@@ -0,0 +1,312 @@
+import hashlib
+import heapq
+import itertools
+import json
+import math
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+from operator import itemgetter
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Utils"))
+import json_stream
+import golden_delta
+import golden_index
+
+# Rough per-item cost of a buffered entry on top of its pickled bytes
+ITEM_OVERHEAD = 100
+
+
+class RunSorter:
+    """Sorts (key, value) pairs that may not fit in memory.
+    Values are kept pickled, and once the buffer passes max_bytes it is sorted and spilled to a temporary run file; iterating merges the runs.
+    Args:
+        max_bytes : int
+            Approximate memory the buffer may use before it is spilled.
+        directory : str
+            Directory the run files are written to.
+    """
+
+    def __init__(self, max_bytes: int, directory: str):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.buffer = []
+        self.size = 0
+        self.runs = []
+
+    def add(self, key, value=None):
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        self.buffer.append((key, data))
+        self.size += len(data) + ITEM_OVERHEAD
+        if self.size >= self.max_bytes:
+            self.spill()
+
+    def spill(self):
+        self.buffer.sort(key=itemgetter(0))
+        handle, path = tempfile.mkstemp(suffix=".run", dir=self.directory)
+        with os.fdopen(handle, "wb") as run_file:
+            for item in self.buffer:
+                pickle.dump(item, run_file, pickle.HIGHEST_PROTOCOL)
+        self.runs.append(path)
+        self.buffer = []
+        self.size = 0
+
+    @staticmethod
+    def read_run(path: str):
+        with open(path, "rb") as run_file:
+            while True:
+                try:
+                    yield pickle.load(run_file)
+                except EOFError:
+                    return
+
+    def __iter__(self):
+        self.buffer.sort(key=itemgetter(0))
+        streams = [self.read_run(path) for path in self.runs] + [iter(self.buffer)]
+        for key, data in heapq.merge(*streams, key=itemgetter(0)):
+            yield key, pickle.loads(data)
+
+
+def sort_key(petalID):
+    """Makes a petalID sortable alongside petalIDs of other types, or returns None if it can never match a golden row.
+    Numbers that compare equal, such as 8 and 8.0, get equal keys, as they do when merge_data looks them up in a dict.
+    """
+
+    if isinstance(petalID, str):
+        return (1, petalID)
+    if isinstance(petalID, (int, float)) and not (isinstance(petalID, float) and math.isnan(petalID)):
+        return (0, petalID)
+    return None
+
+
+def is_missing(value):
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
+
+def first_of_each(sorted_items):
+    """Reduces a stream of ((key, position), value) items sorted by key then position to the first item of every key."""
+
+    for key, group in itertools.groupby(sorted_items, key=lambda item: item[0][0]):
+        (key, position), value = next(group)
+        yield key, position, value
+
+
+def join_sorted(incoming, golden_firsts, matched, unmatched):
+    """Merge joins incoming ((key, seq), record) items with golden (key, position, value) items, both sorted by key.
+    Calls matched(position, seq, record, value) for incoming items whose key exists in the golden stream and unmatched(seq, record) for the rest.
+    """
+
+    current = next(golden_firsts, None)
+    for (key, seq), record in incoming:
+        while current is not None and current[0] < key:
+            current = next(golden_firsts, None)
+        if current is not None and current[0] == key:
+            matched(current[1], seq, record, current[2])
+        else:
+            unmatched(seq, record)
+
+
+def write_json_list(output_file, lines_path: str):
+    """Copies a file of JSON values, one per line, into output_file as the items of a JSON list."""
+
+    output_file.write("[")
+    with open(lines_path, encoding="utf8") as lines_file:
+        for number, line in enumerate(lines_file):
+            if number:
+                output_file.write(", ")
+            output_file.write(line.rstrip("\n"))
+    output_file.write("]")
+
+
+def external_merge(golden_path: str, new_path: str, output_name: str, max_bytes: int,
+                   json_array: bool = False, source: str = None):
+    """Merges new records into the golden dataset without loading either file fully into memory.
+    Both inputs are streamed, and sorted runs spilled to temporary files join them on petalID and then on DOI,
+    Open Alex ID and URL. The result matches merge_records: the same records in the same order, with updates that
+    change nothing skipped. Writes the golden file, its fingerprints, the delta and the manifest like the in-memory path.
+    Args:
+        golden_path : str
+            Path + filename of the golden JSON file.
+        new_path : str
+            Path + filename of the new JSON data.
+        output_name : str
+            Name of the output files, without extension.
+        max_bytes : int
+            Approximate memory each sort buffer may use before spilling to disk.
+        json_array : bool
+            Write the golden file as a bracketed JSON array instead of newline-delimited JSON.
+        source : str
+            Where the base golden dataset was read from, recorded in the manifest.
+    Returns:
+        dict
+            The number of "golden_rows" and "new_rows" read, the "added", "changed" and "unchanged" counts
+            and the "matches" made without a petalID, as merge_records returns them, and the number of records
+            the delta lists as "modified", as compute_delta counts them.
+    """
+
+    directory = tempfile.mkdtemp(prefix="golden_merge_")
+    try:
+        return _external_merge(golden_path, new_path, output_name, max_bytes, json_array,
+                               source or golden_path, directory)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def _external_merge(golden_path, new_path, output_name, max_bytes, json_array, source, directory):
+    # Sort the golden petalIDs and identifying keys, noting the columns and highest petalID
+    golden_columns = {}
+    max_petalID = None
+    golden_ids = RunSorter(max_bytes, directory)
+    golden_keys = {field: RunSorter(max_bytes, directory) for field, normalize in golden_index.KEY_FIELDS}
+    golden_rows = 0
+    for position, record in enumerate(json_stream.read_records(golden_path)):
+        golden_rows += 1
+        golden_columns.update(dict.fromkeys(record))
+        petalID = record.get("petalID")
+        key = sort_key(petalID)
+        if key is not None:
+            golden_ids.add((key, position))
+            if key[0] == 0 and (max_petalID is None or petalID > max_petalID):
+                max_petalID = petalID
+        for field, normalize in golden_index.KEY_FIELDS:
+            value = normalize(record.get(field))
+            if value:
+                golden_keys[field].add((value, position), petalID)
+
+    # Sort the new records by petalID, keeping those that cannot match aside in input order
+    new_columns = {}
+    incoming = RunSorter(max_bytes, directory)
+    unmatched = RunSorter(max_bytes, directory)
+    new_rows = 0
+    for seq, record in enumerate(json_stream.read_records(new_path)):
+        new_rows += 1
+        new_columns.update(dict.fromkeys(record))
+        key = sort_key(record.get("petalID"))
+        if key is None:
+            unmatched.add(seq, record)
+        else:
+            incoming.add((key, seq), record)
+
+    updates = RunSorter(max_bytes, directory)
+    join_sorted(iter(incoming), first_of_each(iter(golden_ids)),
+                lambda position, seq, record, value: updates.add((position, seq), (record, False)),
+                lambda seq, record: unmatched.add(seq, record))
+
+    # Match what is left on DOI, then Open Alex ID, then URL
+    matches = []
+    for field, normalize in golden_index.KEY_FIELDS:
+        keyed = RunSorter(max_bytes, directory)
+        remaining = RunSorter(max_bytes, directory)
+        for seq, record in unmatched:
+            value = normalize(record.get(field))
+            if value:
+                keyed.add((value, seq), record)
+            else:
+                remaining.add(seq, record)
+
+        def matched(position, seq, record, petalID, field=field, normalize=normalize):
+            updates.add((position, seq), (record, True))
+            matches.append((seq, field, normalize(record.get(field)), petalID))
+
+        join_sorted(iter(keyed), first_of_each(iter(golden_keys[field])), matched, remaining.add)
+        unmatched = remaining
+    matches = [match[1:] for match in sorted(matches)]
+
+    # The last record for a golden row wins
+    last_updates = ((position, list(group)[-1][1])
+                    for position, group in itertools.groupby(updates, key=lambda item: item[0][0]))
+
+    columns = list(golden_columns) + [column for column in new_columns if column not in golden_columns]
+    shared_columns = ["petalID"] + [column for column in new_columns
+                                    if column in golden_columns and column != "petalID"]
+
+    def fill(record):
+        return {column: "" if is_missing(record.get(column)) else record.get(column) for column in columns}
+
+    # Stream the golden rows in order, applying updates, then append the new records
+    counts = {"added": 0, "changed": 0, "unchanged": 0, "modified": 0}
+    base_digest = hashlib.sha256()
+    result_digest = hashlib.sha256()
+    golden_file = f"{output_name}.json"
+    hashes_path = os.path.join(directory, "hashes")
+    added_path = os.path.join(directory, "added")
+    modified_path = os.path.join(directory, "modified")
+    with json_stream.JsonRecordWriter(golden_file, json_array) as writer, \
+            open(hashes_path, "w") as hashes_file, open(added_path, "w") as added_file, \
+            open(modified_path, "w") as modified_file:
+
+        def emit(record):
+            record_hash = golden_delta.record_hash(record)
+            result_digest.update(record_hash.encode("ascii"))
+            hashes_file.write(json.dumps(record_hash) + "\n")
+            writer.write(record)
+            return record_hash
+
+        update = next(last_updates, None)
+        for position, record in enumerate(json_stream.read_records(golden_path)):
+            base_hash = golden_delta.record_hash(record)
+            base_digest.update(base_hash.encode("ascii"))
+            if update is None or update[0] != position:
+                emit(fill(record))
+                continue
+
+            # Records matched without a petalID only fill in values, blanks keep what the golden row has,
+            # and are compared as if they carried the golden petalID
+            incoming, by_key = update[1]
+            if by_key:
+                incoming = golden_index.fill_blanks({column: incoming.get(column) for column in new_columns}, record)
+            incoming = dict(incoming, petalID=record.get("petalID"))
+            update = next(last_updates, None)
+            current = {column: record.get(column) for column in shared_columns}
+            if golden_delta.record_hash(incoming) == golden_delta.record_hash(current):
+                counts["unchanged"] += 1
+                emit(fill(record))
+                continue
+
+            counts["changed"] += 1
+            merged = dict(record)
+            for column in new_columns:
+                if column != "petalID":
+                    merged[column] = incoming.get(column)
+            merged = fill(merged)
+            # Modified means the stored record's hash changed, as compute_delta decides it
+            if emit(merged) != base_hash:
+                counts["modified"] += 1
+                modified_file.write(json.dumps(merged) + "\n")
+
+        next_petalID = max_petalID + 1 if max_petalID is not None else 1
+        for seq, record in unmatched:
+            record = dict(record, petalID=next_petalID)
+            next_petalID += 1
+            counts["added"] += 1
+            record = fill(record)
+            emit(record)
+            added_file.write(json.dumps(record) + "\n")
+
+    summary = {
+        "base_hash": base_digest.hexdigest(),
+        "result_hash": result_digest.hexdigest(),
+        "added": counts["added"],
+        "modified": counts["modified"],
+        "removed": 0
+    }
+
+    # Written by hand so the delta and fingerprints never have to be held in memory
+    delta_path = f"{output_name}.delta.json"
+    with open(delta_path, "w") as delta_file:
+        delta_file.write('{{"base_hash": "{}", "result_hash": "{}", "added": '.format(
+            summary["base_hash"], summary["result_hash"]))
+        write_json_list(delta_file, added_path)
+        delta_file.write(', "modified": ')
+        write_json_list(delta_file, modified_path)
+        delta_file.write(', "removed": []}')
+    with open(f"{output_name}.fingerprints.json", "w") as fingerprints_file:
+        fingerprints_file.write('{{"golden_sha256": "{}", "hashes": '.format(golden_delta.file_hash(golden_file)))
+        write_json_list(fingerprints_file, hashes_path)
+        fingerprints_file.write("}")
+    golden_delta.write_manifest(f"{output_name}.manifest.json", golden_file, delta_path, summary, source)
+
+    counts.update({"golden_rows": golden_rows, "new_rows": new_rows, "matches": matches})
+    return counts
@@ -0,0 +1,95 @@
+import math
+import os
+import sys
+
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Utils"))
+from paper_ids import normalize_doi, normalize_paper_id, normalize_url
+
+
+def is_blank(value):
+    """Tells whether a value is missing or empty, so a record matched by key should not overwrite the golden value with it."""
+
+    return value is None or (isinstance(value, float) and math.isnan(value)) or (isinstance(value, str) and value == "")
+
+
+def fill_blanks(record: dict, current: dict):
+    """Returns the record with every blank value replaced by the value in current, if current has one."""
+
+    return {column: current[column] if is_blank(value) and column in current else value
+            for column, value in record.items()}
+
+
+# Fields that identify a paper, in the order they are tried
+KEY_FIELDS = (
+    ("doi", normalize_doi),
+    ("paper", normalize_paper_id),
+    ("url", normalize_url)
+)
+
+
+def build_indexes(golden: pd.DataFrame):
+    """Indexes the golden rows by normalized DOI, Open Alex ID and URL, keeping the first row for each value.
+    Args:
+        golden : pd.DataFrame
+            DataFrame containing the golden records.
+    Returns:
+        dict
+            Maps each key field to a dict from normalized value to row position.
+    """
+
+    indexes = {}
+    for field, normalize in KEY_FIELDS:
+        index = {}
+        if field in golden.columns:
+            for position, value in enumerate(golden[field].tolist()):
+                key = normalize(value)
+                if key:
+                    index.setdefault(key, position)
+        indexes[field] = index
+    return indexes
+
+
+def match_records(records: pd.DataFrame, indexes: dict):
+    """Looks up records in the golden indexes, trying DOI, then Open Alex ID, then URL.
+    Args:
+        records : pd.DataFrame
+            Incoming records that did not match any golden petalID.
+        indexes : dict
+            Indexes built by build_indexes.
+    Returns:
+        list
+            One (position, field, value) tuple per record; position is -1 and field and value are empty if nothing matched.
+    """
+
+    matches = [(-1, "", "")] * records.shape[0]
+    for field, normalize in KEY_FIELDS:
+        if field not in records.columns or not indexes[field]:
+            continue
+        for row, value in enumerate(records[field].tolist()):
+            if matches[row][0] >= 0:
+                continue
+            key = normalize(value)
+            if key in indexes[field]:
+                matches[row] = (indexes[field][key], field, key)
+    return matches
+
+
+def report_matches(matches: list):
+    """Prints the incoming records that were matched to existing golden rows by DOI, Open Alex ID or URL.
+    Args:
+        matches : list
+            (field, value, petalID) tuples.
+    """
+
+    if not matches:
+        return
+    fields = {}
+    for field, value, petalID in matches:
+        fields.setdefault(field, []).append((value, petalID))
+    print("Records matched to existing rows without their petalID: {}".format(len(matches)))
+    for field, papers in fields.items():
+        print("  by {}: {}".format(field, len(papers)))
+        for value, petalID in papers:
+            print("    {} -> petalID {}".format(value, petalID))
@@ -0,0 +1,96 @@
+import json
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Golden columns holding lists of values
+LIST_COLUMNS = (
+    "level1", "level2", "level3", "mesh_terms", "venue_ids", "venue_names", "author_ids",
+    "author_names", "reference_ids", "species", "absolute_relevancy", "relative_relevancy",
+    "mag_terms"
+)
+# String columns with fewer distinct values than this share of rows are dictionary encoded
+DICTIONARY_RATIO = 0.5
+
+
+def stringify(value):
+    return value if isinstance(value, str) else json.dumps(value)
+
+
+def to_list_array(values: list):
+    """Converts a golden list column into a native Arrow list array, turning empty cells into empty lists."""
+
+    lists = [value if isinstance(value, list) else [] for value in values]
+    try:
+        return pa.array(lists)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        return pa.array([[stringify(item) for item in value] for value in lists],
+                        type=pa.list_(pa.string()))
+
+
+def to_scalar_array(values: list):
+    """Converts a golden scalar column into an Arrow array, dictionary encoding repetitive strings."""
+
+    try:
+        array = pa.array(values, from_pandas=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # Columns such as isOpenAccess mix real values with "" for missing ones
+        values = [None if value == "" else value for value in values]
+        try:
+            array = pa.array(values, from_pandas=True)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            array = pa.array([None if value is None else stringify(value) for value in values],
+                             type=pa.string())
+
+    if pa.types.is_string(array.type) and len(array):
+        if len(array.unique()) < DICTIONARY_RATIO * len(array):
+            array = array.dictionary_encode()
+    return array
+
+
+def golden_to_table(golden: pd.DataFrame):
+    """Converts the golden DataFrame into an Arrow table with native list columns.
+    Args:
+        golden : pd.DataFrame
+            DataFrame containing the golden records.
+    Returns:
+        pa.Table
+            The table, one column per golden column.
+    """
+
+    arrays = []
+    for column in golden.columns:
+        values = golden[column].tolist()
+        if column in LIST_COLUMNS:
+            arrays.append(to_list_array(values))
+        else:
+            arrays.append(to_scalar_array(values))
+    return pa.Table.from_arrays(arrays, names=[str(column) for column in golden.columns])
+
+
+def write_parquet(golden: pd.DataFrame, path: str):
+    """Writes the golden DataFrame as a Parquet sidecar file.
+    Args:
+        golden : pd.DataFrame
+            DataFrame containing the golden records.
+        path : str
+            Path + filename of the Parquet file.
+    """
+
+    pq.write_table(golden_to_table(golden), path, use_dictionary=True, compression="zstd")
+
+
+def read_golden(path: str, columns: list = None):
+    """Loads the golden Parquet sidecar through a memory map, reading only the requested columns.
+    Args:
+        path : str
+            Path + filename of the Parquet file.
+        columns : list
+            Names of the columns to load, or None for all of them.
+    Returns:
+        pd.DataFrame
+            The golden records; list columns hold numpy arrays and dictionary encoded columns are categoricals.
+    """
+
+    return pq.read_table(path, columns=columns, memory_map=True).to_pandas()
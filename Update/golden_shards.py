@@ -0,0 +1,155 @@
+"""A read-side copy of the golden dataset partitioned into petalID range shards.
+The shards are written from a merged golden and never merged into; update_golden.py merges the whole golden first.
+"""
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Utils"))
+import json_stream
+from golden_delta import file_hash
+
+INDEX_NAME = "index.json"
+DEFAULT_SHARD_SIZE = 10000
+
+
+def shard_name(shard_id: int):
+    return "shard_{:05d}.json".format(shard_id)
+
+
+def shard_of(petalID, shard_size: int):
+    """Returns the shard holding a petalID; shard n covers petalIDs n * shard_size + 1 to (n + 1) * shard_size."""
+
+    return (int(petalID) - 1) // shard_size
+
+
+def read_index(directory: str):
+    with open(os.path.join(directory, INDEX_NAME), encoding="utf8") as index_file:
+        return json.load(index_file)
+
+
+def write_index(directory: str, index: dict):
+    with open(os.path.join(directory, INDEX_NAME), "w") as index_file:
+        json.dump(index, index_file, indent=4)
+
+
+def has_shards(directory: str):
+    return os.path.isfile(os.path.join(directory, INDEX_NAME))
+
+
+def read_shard(path: str):
+    return pd.DataFrame(json_stream.read_records(path))
+
+
+def write_shard(path: str, shard: pd.DataFrame):
+    """Writes one shard as a JSON array and returns its index entry."""
+
+    json_stream.write_frame(path, shard, True)
+    petalIDs = shard["petalID"]
+    return {
+        "file": os.path.basename(path),
+        "first_petalID": int(petalIDs.min()),
+        "last_petalID": int(petalIDs.max()),
+        "records": int(shard.shape[0]),
+        "sha256": file_hash(path)
+    }
+
+
+def write_shards(golden: pd.DataFrame, directory: str, shard_size: int = DEFAULT_SHARD_SIZE,
+                 processes: int = None):
+    """Splits the golden dataset into petalID range shards, writing them in parallel along with the shard index.
+    Args:
+        golden : pd.DataFrame
+            DataFrame containing the golden records.
+        directory : str
+            Directory the shards and index are written to.
+        shard_size : int
+            Number of petalIDs covered by each shard.
+        processes : int
+            Size of the process pool, or None for one per CPU.
+    Returns:
+        dict
+            The shard index.
+    """
+
+    os.makedirs(directory, exist_ok=True)
+    shard_ids = golden["petalID"].map(lambda petalID: shard_of(petalID, shard_size))
+    groups = [(os.path.join(directory, shard_name(shard_id)), shard)
+              for shard_id, shard in golden.groupby(shard_ids, sort=True)]
+
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        entries = list(executor.map(write_shard, *zip(*groups))) if groups else []
+
+    index = {
+        "shard_size": shard_size,
+        "next_petalID": int(golden["petalID"].max()) + 1 if golden.shape[0] else 1,
+        "shards": entries
+    }
+    write_index(directory, index)
+    return index
+
+
+def sync_shards(golden: pd.DataFrame, directory: str, delta: dict, shard_size: int = DEFAULT_SHARD_SIZE,
+                processes: int = None):
+    """Brings a sharded copy of the golden dataset up to date with a newly merged golden.
+    If the shards were last written from the base snapshot of the delta, only the shards holding added, modified or
+    removed petalIDs are rewritten; otherwise every shard is written again.
+    Args:
+        golden : pd.DataFrame
+            DataFrame containing the merged golden records.
+        directory : str
+            Directory holding the shards and index.
+        delta : dict
+            The delta between the base golden and golden, as given by golden_delta.compute_delta.
+        shard_size : int
+            Number of petalIDs covered by each shard.
+        processes : int
+            Size of the process pool, or None for one per CPU.
+    Returns:
+        dict
+            The shard index.
+    """
+
+    index = read_index(directory) if has_shards(directory) else None
+    if index is None or index["shard_size"] != shard_size or index.get("dataset_hash") != delta["base_hash"]:
+        index = write_shards(golden, directory, shard_size, processes)
+    else:
+        petalIDs = [record["petalID"] for record in delta["added"] + delta["modified"]] + delta["removed"]
+        touched = set(shard_of(petalID, shard_size) for petalID in petalIDs)
+        shard_ids = golden["petalID"].map(lambda petalID: shard_of(petalID, shard_size))
+        groups = [(os.path.join(directory, shard_name(shard_id)), shard)
+                  for shard_id, shard in golden.groupby(shard_ids, sort=True) if shard_id in touched]
+
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            entries = list(executor.map(write_shard, *zip(*groups))) if groups else []
+
+        # Shards left without records are removed
+        shard_files = {entry["file"]: entry for entry in index["shards"]}
+        written = {entry["file"]: entry for entry in entries}
+        for shard_id in touched:
+            name = shard_name(shard_id)
+            shard_files.pop(name, None)
+            if name not in written and os.path.isfile(os.path.join(directory, name)):
+                os.remove(os.path.join(directory, name))
+        shard_files.update(written)
+
+        index["shards"] = [shard_files[name] for name in sorted(shard_files)]
+        index["next_petalID"] = int(golden["petalID"].max()) + 1 if golden.shape[0] else 1
+    index["dataset_hash"] = delta["result_hash"]
+    write_index(directory, index)
+    return index
+
+
+def load_shards(directory: str, processes: int = None):
+    """Reads every shard in parallel and joins them back into one golden DataFrame ordered by shard."""
+
+    index = read_index(directory)
+    paths = [os.path.join(directory, entry["file"]) for entry in index["shards"]]
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        shards = list(executor.map(read_shard, paths))
+    if not shards:
+        return pd.DataFrame()
+    return pd.concat(shards, ignore_index=True).fillna("")
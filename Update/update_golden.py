@@ -1,10 +1,21 @@
 import pandas as pd
+import numpy as np
 import argparse
-import json
 import os
+import sys
 
 from pandas.core.reshape.merge import merge
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Utils"))
+import json_stream
+from stage_metrics import StageMetrics
+import golden_delta
+from golden_cache import GoldenCache, RAW_NAME
+import golden_parquet
+import golden_shards
+import golden_index
+import golden_external
+
 def get_arg_parser():
     """Allows arguments to be passed into this program through the terminal.
     Returns:
@@ -25,8 +36,141 @@ def get_arg_parser():
     parser.add_argument(
         "new_file_path", help="Full path to new JSON data", type=json_path)
     parser.add_argument("output_name", help="Name of output file", type=str)
+    parser.add_argument("--json-array", help="Write a bracketed JSON array instead of newline-delimited JSON",
+                        action="store_true")
+    parser.add_argument("--golden-cache", help="Directory used to cache a remote golden file between runs",
+                        type=str, default=".golden_cache")
+    parser.add_argument("--shards", help="Directory of a read-side, petalID-sharded copy of the new golden",
+                        type=str, default=None)
+    parser.add_argument("--shard-size", help="Number of petalIDs covered by each shard",
+                        type=int, default=golden_shards.DEFAULT_SHARD_SIZE)
+    parser.add_argument("--processes", help="Size of the process pool used to write shards",
+                        type=int, default=None)
+    parser.add_argument("--max-memory", help="Merge out of core, spilling sorted runs to disk past this many MiB",
+                        type=int, default=None)
+
+    args = parser.parse_args()
+    if args.shards and args.max_memory:
+        parser.error("--shards needs the merged golden in memory and cannot be combined with --max-memory")
+    return args
+
+def merge_records(new_json: pd.DataFrame, golden: pd.DataFrame, golden_hashes: list = None, indexes: dict = None):
+    """ Will update a row if the assigned petalID already exists within the dataset, or it will add new rows.
+    Records without a known petalID are matched to existing rows by DOI, Open Alex ID or URL before being added;
+    such matches only fill in values, leaving the golden value wherever the incoming one is empty.
+    Updates whose content hash matches the existing record are skipped.
+    Args:
+        new_json : pd.DataFrame
+            DataFrame containing records from the newly created JSON file we wish to add.
+        golden : pd.DataFrame
+            DataFrame containing records from the original golden JSON file.
+        golden_hashes : list
+            Content hash of every golden row, as given by golden_delta.frame_hashes, if already known.
+        indexes : dict
+            Golden indexes from golden_index.build_indexes, built here if not given.
+    Returns:
+        dict
+            The merged DataFrame under "golden", the counts of "added", "changed" and "unchanged" records,
+            under "hashes" the content hash of every merged row, or None if golden_hashes was not given,
+            and under "matches" a (field, value, petalID) tuple for every record matched without its petalID.
+    """
+
+    golden = golden.copy()
+    if "petalID" in new_json.columns:
+        new_ids = new_json["petalID"]
+    else:
+        new_ids = pd.Series([None]*new_json.shape[0], index=new_json.index, dtype=object)
+
+    # Index the first golden row of every petalID
+    first_rows = ~golden["petalID"].duplicated(keep="first")
+    golden_positions = dict(zip(golden["petalID"][first_rows], np.flatnonzero(first_rows)))
+    target_positions = new_ids.map(lambda petalID: golden_positions.get(petalID, -1)
+                                   if pd.notna(petalID) else -1).astype(np.intp)
+
+    # Match the remaining records on their DOI, Open Alex ID or URL
+    if indexes is None:
+        indexes = golden_index.build_indexes(golden)
+    unmatched = target_positions[target_positions < 0].index
+    key_matches = golden_index.match_records(new_json.loc[unmatched], indexes)
+    golden_ids = golden["petalID"].tolist()
+    matches = []
+    key_matched = pd.Series(False, index=new_json.index)
+    for row, (position, field, value) in zip(unmatched, key_matches):
+        if position >= 0:
+            target_positions[row] = position
+            key_matched[row] = True
+            matches.append((field, value, golden_ids[position]))
+    is_update = (target_positions >= 0).to_numpy()
+
+    # Update existing data, the last occurrence of a repeated petalID wins
+    updates = new_json[is_update]
+    update_positions = target_positions[is_update]
+    last_updates = ~update_positions.duplicated(keep="last").to_numpy()
+    updates = updates[last_updates]
+    update_positions = update_positions[last_updates].to_numpy(dtype=np.intp)
+    key_updates = key_matched.to_numpy()[is_update][last_updates]
+
+    # Records matched without a petalID only fill in values, blanks keep what the golden row has
+    if key_updates.any():
+        updates = updates.copy()
+        for column in updates.columns:
+            if column == "petalID" or column not in golden.columns:
+                continue
+            values = updates[column].to_numpy(dtype=object, copy=True)
+            keep = key_updates & np.array([golden_index.is_blank(value) for value in values], dtype=bool)
+            values[keep] = golden[column].to_numpy(dtype=object)[update_positions[keep]]
+            updates[column] = values
+
+    # Skip updates that would leave the record as it is, hashing records matched
+    # without a petalID as if they carried the petalID of their golden row
+    hashed_updates = updates.copy()
+    hashed_updates["petalID"] = golden["petalID"].to_numpy(dtype=object)[update_positions]
+    if golden_hashes is not None and set(golden.columns) <= set(hashed_updates.columns):
+        current_hashes = [golden_hashes[position] for position in update_positions]
+    else:
+        shared_columns = [column for column in hashed_updates.columns if column in golden.columns]
+        current_hashes = golden_delta.frame_hashes(golden[shared_columns].iloc[update_positions])
+    changed = np.array([update_hash != current_hash for update_hash, current_hash
+                        in zip(golden_delta.frame_hashes(hashed_updates), current_hashes)], dtype=bool)
+    changed_positions = update_positions[changed]
+
+    if len(update_positions):
+        for column in new_json.columns:
+            if column == "petalID":
+                # Matched petalIDs are already equal, keep the golden dtype
+                continue
+            if column in golden.columns:
+                values = golden[column].to_numpy(dtype=object, copy=True)
+            else: # new_json has added columns.
+                values = np.full(golden.shape[0], None, dtype=object)
+            values[changed_positions] = updates[column].to_numpy(dtype=object)[changed]
+            golden[column] = values
+
+    hashes = None
+    if golden_hashes is not None:
+        hashes = list(golden_hashes)
+        for position, hash_value in zip(changed_positions,
+                                        golden_delta.frame_hashes(golden.iloc[changed_positions])):
+            hashes[position] = hash_value
+
+    # Add new rows
+    new_rows = new_json[~is_update].copy()
+    if new_rows.shape[0]:
+        current_index = golden["petalID"].max() + 1
+        new_rows["petalID"] = current_index + np.arange(new_rows.shape[0])
+        golden = pd.concat([golden, new_rows], ignore_index=True)
+        if hashes is not None:
+            hashes.extend(golden_delta.frame_hashes(new_rows))
+
+    return {
+        "golden": golden.fillna(""),
+        "hashes": hashes,
+        "added": int(new_rows.shape[0]),
+        "changed": int(changed.sum()),
+        "unchanged": int(len(changed) - changed.sum()),
+        "matches": matches
+    }
 
-    return parser.parse_args()
 
 def merge_data(new_json: pd.DataFrame, golden: pd.DataFrame):
     """ Will update a row if the assigned petalID already exists within the dataset, or it will add new rows.
@@ -40,58 +184,89 @@ def merge_data(new_json: pd.DataFrame, golden: pd.DataFrame):
             DataFrame containing merged records from the new_json file and the golden DataFrame.
     """
 
-    df_columns = golden.columns
-    new_rows = []
-    petalIDList = golden["petalID"].to_list()
-    for index, row in new_json.iterrows():
-        petalID = row.get('petalID', None)
-        if petalID in petalIDList:
-            # Update existing data
-            # get index
-            indices = golden[golden["petalID"] == petalID].index.values
-            if len(indices):
-                found_index = indices[0]
-                for series_key in row.keys():
-                    if series_key in df_columns:
-                        golden.at[found_index, series_key] = row[series_key]
-                    else: # new_json has added columns.
-                        #create the column
-                        golden[series_key] = None
-                        #update the column in the current row.
-                        golden.at[found_index, series_key] = row[series_key] 
-        else:
-            # Add new row 
-            new_rows.append(row)
-    if len(new_rows):
-        current_index = golden["petalID"].max() + 1
-        for new_row in new_rows:
-            new_row["petalID"] = current_index
-            current_index += 1
-        golden = pd.concat([golden, pd.DataFrame(new_rows)], ignore_index=True)
-        
-    return golden.fillna("")
+    return merge_records(new_json, golden)["golden"]
 
 
 if __name__ == "__main__":
     args = get_arg_parser()
-    try:
-        golden = pd.read_json(args.golden_path + ".json")
-        new_file = pd.read_json(args.new_file_path + ".json")
-    except:
-        print("Failed to load files")
-        raise
-
-    new_golden = merge_data(new_file, golden)
-        
-    with open(f"{args.output_name}.json", "w") as golden_file:
-        golden_file.write("[\n")
-        golden_size = new_golden.shape[0]
-
-        for index, row in new_golden.iterrows():
-            golden_file.write("\t")
-            golden_file.write(json.dumps(row.to_dict()))
-
-            if(index < golden_size - 1):
-                golden_file.write(",\n")
-
-        golden_file.write("\n]")
\ No newline at end of file
+    with StageMetrics("update") as metrics:
+        if args.max_memory:
+            # Stream both files instead of loading them into pandas
+            golden_file = args.golden_path + ".json"
+            if args.golden_path.startswith("https://"):
+                golden_cache = GoldenCache(args.golden_cache)
+                golden_cache.download(golden_file)
+                print("Golden dataset: {}".format(golden_cache.status))
+                golden_file = golden_cache.path(RAW_NAME)
+            merged = golden_external.external_merge(
+                golden_file, args.new_file_path + ".json", args.output_name, args.max_memory * 2**20,
+                args.json_array, args.golden_path + ".json")
+            golden_index.report_matches(merged["matches"])
+            print("Added {}, changed {} and left {} records unchanged".format(
+                merged["added"], merged["changed"], merged["unchanged"]))
+
+            metrics.rows = merged["golden_rows"] + merged["added"]
+            metrics.add("golden_rows", merged["golden_rows"])
+            metrics.add("new_rows", merged["new_rows"])
+            metrics.add("added", merged["added"])
+            metrics.add("modified", merged["modified"])
+            metrics.add("unchanged", merged["unchanged"])
+            metrics.add("matched_without_petalID", len(merged["matches"]))
+            metrics.add("removed", 0)
+        else:
+            try:
+                if args.golden_path.startswith("https://"):
+                    golden_cache = GoldenCache(args.golden_cache)
+                    golden = golden_cache.load(args.golden_path + ".json")
+                    print("Golden dataset: {}".format(golden_cache.status))
+                else:
+                    golden = pd.read_json(args.golden_path + ".json", precise_float=True)
+                new_file = pd.DataFrame(json_stream.read_records(args.new_file_path + ".json"))
+            except:
+                print("Failed to load files")
+                raise
+
+            metrics.add("golden_rows", golden.shape[0])
+            metrics.add("new_rows", new_file.shape[0])
+
+            # Reuse the record hashes stored with the last output if it is the golden we just loaded
+            if args.golden_path.startswith("https://"):
+                golden_sha256 = golden_cache.read_meta()["sha256"]
+            else:
+                golden_sha256 = golden_delta.file_hash(args.golden_path + ".json")
+            fingerprints_path = f"{args.output_name}.fingerprints.json"
+            golden_hashes = golden_delta.read_fingerprints(fingerprints_path, golden_sha256, golden.shape[0])
+            if golden_hashes is None:
+                golden_hashes = golden_delta.frame_hashes(golden)
+
+            merged = merge_records(new_file, golden, golden_hashes)
+            new_golden = merged["golden"]
+            golden_index.report_matches(merged["matches"])
+            print("Added {}, changed {} and left {} records unchanged".format(
+                merged["added"], merged["changed"], merged["unchanged"]))
+
+            new_records = list(json_stream.frame_records(new_golden))
+            metrics.rows = json_stream.write_records(
+                f"{args.output_name}.json", new_records, args.json_array)
+            golden_delta.write_fingerprints(fingerprints_path, f"{args.output_name}.json", merged["hashes"])
+
+            # Record what changed so consumers can process only the delta
+            delta = golden_delta.compute_delta(
+                golden.to_dict("records"), new_records, golden_hashes, merged["hashes"])
+            golden_delta.write_delta(f"{args.output_name}.delta.json", delta)
+            golden_delta.write_manifest(
+                f"{args.output_name}.manifest.json", f"{args.output_name}.json",
+                f"{args.output_name}.delta.json", golden_delta.summarize_delta(delta),
+                args.golden_path + ".json")
+            golden_parquet.write_parquet(new_golden, f"{args.output_name}.parquet")
+
+            metrics.add("added", len(delta["added"]))
+            metrics.add("modified", len(delta["modified"]))
+            metrics.add("unchanged", merged["unchanged"])
+            metrics.add("matched_without_petalID", len(merged["matches"]))
+            metrics.add("removed", len(delta["removed"]))
+
+            if args.shards:
+                # The golden file stays the source of truth, the shards are rebuilt from the merged result
+                index = golden_shards.sync_shards(new_golden, args.shards, delta, args.shard_size, args.processes)
+                metrics.add("shards", len(index["shards"]))
@@ -0,0 +1,146 @@
+import random
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """Blocking token bucket allowing `rate` requests per second with bursts of up to `capacity`.
+    Args:
+        rate : float
+            Tokens added per second.
+        capacity : float
+            Maximum number of tokens held at once.
+    """
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class HttpClient:
+    """Pooled HTTP client with hard timeouts, per-host rate limits and bounded exponential backoff.
+    Args:
+        timeout : tuple
+            (connect, read) timeouts in seconds applied to every request.
+        max_retries : int
+            Number of retries after a 429/5xx response or a connection error.
+        backoff_factor : float
+            Base delay in seconds, doubled on each retry.
+        max_backoff : float
+            Upper bound on a single delay in seconds.
+        rate_limits : dict
+            Requests per second allowed for specific hosts.
+        default_rate : float
+            Requests per second allowed for any other host, or None for no limit.
+        pool_size : int
+            Number of keep-alive connections kept per host.
+        headers : dict
+            Headers sent with every request.
+    """
+
+    def __init__(self, timeout: tuple = (10, 30), max_retries: int = 5,
+                 backoff_factor: float = 0.5, max_backoff: float = 30,
+                 rate_limits: dict = None, default_rate: float = None,
+                 pool_size: int = 16, headers: dict = None):
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.rate_limits = rate_limits or {}
+        self.default_rate = default_rate
+        self.buckets = {}
+        self.buckets_lock = threading.Lock()
+        self.requests = 0
+        self.bytes = 0
+        self.retries = 0
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        if headers:
+            self.session.headers.update(headers)
+
+    def get_bucket(self, url: str):
+        host = urlparse(url).netloc
+        rate = self.rate_limits.get(host, self.default_rate)
+        if rate is None:
+            return None
+        with self.buckets_lock:
+            if host not in self.buckets:
+                self.buckets[host] = TokenBucket(rate)
+            return self.buckets[host]
+
+    def get_delay(self, attempt: int, response: requests.Response = None):
+        """Works out how long to wait before a retry, honouring a Retry-After header in seconds."""
+
+        if response is not None:
+            retry_after = response.headers.get("Retry-After", "")
+            if retry_after.isdigit():
+                return min(self.max_backoff, float(retry_after))
+        delay = self.backoff_factor * (2 ** attempt)
+        return min(self.max_backoff, delay + random.uniform(0, self.backoff_factor))
+
+    def get(self, url: str, **kwargs):
+        """Makes a rate limited GET request, retrying on 429/5xx responses and connection errors.
+        Args:
+            url : str
+                The URL to request.
+            **kwargs
+                Passed through to requests.Session.get.
+        Returns:
+            requests.Response
+                The final response, which may still have a 429/5xx status once retries run out.
+        Raises:
+            requests.RequestException
+                If the last attempt failed without a response.
+        """
+
+        kwargs.setdefault("timeout", self.timeout)
+        bucket = self.get_bucket(url)
+        attempt = 0
+        while True:
+            if bucket is not None:
+                bucket.acquire()
+            try:
+                response = self.session.get(url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt >= self.max_retries:
+                    raise
+                response = None
+            with self.buckets_lock:
+                self.requests += 1
+                if response is not None:
+                    self.bytes += len(response.content)
+            if response is not None and (response.status_code not in RETRY_STATUSES
+                                         or attempt >= self.max_retries):
+                return response
+
+            time.sleep(self.get_delay(attempt, response))
+            attempt += 1
+            with self.buckets_lock:
+                self.retries += 1
+
+    def close(self):
+        self.session.close()
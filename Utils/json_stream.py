@@ -0,0 +1,225 @@
+import json
+
+
+class JsonRecordWriter:
+    """Writes records to a file one at a time, either as newline-delimited JSON or as the bracketed array used by the golden dataset.
+    Args:
+        path : str
+            Path + filename of the output file.
+        json_array : bool
+            Emit a bracketed JSON array with one record per line instead of newline-delimited JSON.
+        dumps : callable
+            Serializer turning one record into a JSON string; it must match json.dumps output for the files to stay byte-identical.
+    """
+
+    def __init__(self, path: str, json_array: bool = False, dumps=json.dumps):
+        self.file = open(path, "w")
+        self.json_array = json_array
+        self.dumps = dumps
+        self.count = 0
+        if self.json_array:
+            self.file.write("[\n")
+
+    def write(self, record: dict):
+        self.write_lines([self.dumps(record)])
+
+    def write_lines(self, lines: list):
+        """Writes records that are already serialized, joining them into a single write."""
+
+        if not lines:
+            return
+        if self.json_array:
+            prefix = ",\n\t" if self.count else "\t"
+            self.file.write(prefix + ",\n\t".join(lines))
+        else:
+            self.file.write("\n".join(lines) + "\n")
+        self.count += len(lines)
+
+    def close(self):
+        if self.json_array:
+            self.file.write("\n]")
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def write_records(path: str, records, json_array: bool = False, batch_size: int = 1000, dumps=json.dumps):
+    """Writes an iterable of records to a file as they are produced, serializing and writing them in batches.
+    Args:
+        path : str
+            Path + filename of the output file.
+        records : iterable
+            Records to write, each a JSON serializable dict.
+        json_array : bool
+            Emit a bracketed JSON array instead of newline-delimited JSON.
+        batch_size : int
+            Number of records serialized and written at a time.
+        dumps : callable
+            Serializer turning one record into a JSON string.
+    Returns:
+        int
+            The number of records written.
+    """
+
+    with JsonRecordWriter(path, json_array, dumps) as writer:
+        batch = []
+        for record in records:
+            batch.append(dumps(record))
+            if len(batch) == batch_size:
+                writer.write_lines(batch)
+                batch = []
+        writer.write_lines(batch)
+    return writer.count
+
+
+def frame_records(frame):
+    """Yields the rows of a DataFrame as dicts, reading each column once instead of building a Series per row.
+    Args:
+        frame : pd.DataFrame
+            DataFrame to convert.
+    Returns:
+        generator
+            Each row as a dict with the same values row.to_dict() gives for iterrows().
+    """
+
+    columns = list(frame.columns)
+    for values in zip(*(frame[column].tolist() for column in columns)):
+        yield dict(zip(columns, values))
+
+
+def write_frame(path: str, frame, json_array: bool = False, batch_size: int = 1000, dumps=json.dumps):
+    """Writes every row of a DataFrame as a record without going through iterrows().
+    Args:
+        path : str
+            Path + filename of the output file.
+        frame : pd.DataFrame
+            DataFrame to write.
+        json_array : bool
+            Emit a bracketed JSON array instead of newline-delimited JSON.
+        batch_size : int
+            Number of records serialized and written at a time.
+        dumps : callable
+            Serializer turning one record into a JSON string.
+    Returns:
+        int
+            The number of records written.
+    """
+
+    return write_records(path, frame_records(frame), json_array, batch_size, dumps)
+
+
+def iter_json_array(json_file, chunk_size: int = 1 << 20):
+    """Decodes the items of a JSON array one at a time, whatever its layout, reading the file in chunks.
+    Args:
+        json_file : file
+            Text file positioned at or before the opening bracket.
+        chunk_size : int
+            Number of characters read at a time.
+    Returns:
+        generator
+            Each item of the array.
+    Raises:
+        json.JSONDecodeError
+            If the file is not a single JSON array.
+    """
+
+    decoder = json.JSONDecoder()
+    buffer = ""
+    position = 0
+    at_end = False
+
+    def fill():
+        nonlocal buffer, position, at_end
+        chunk = json_file.read(chunk_size)
+        at_end = not chunk
+        buffer = buffer[position:] + chunk
+        position = 0
+
+    def next_token():
+        """Skips whitespace and returns the next character, or "" at the end of the file."""
+
+        nonlocal position
+        while True:
+            while position < len(buffer) and buffer[position].isspace():
+                position += 1
+            if position < len(buffer) or at_end:
+                return buffer[position:position + 1]
+            fill()
+
+    if next_token() != "[":
+        raise json.JSONDecodeError("Expected a JSON array", buffer, position)
+    position += 1
+    expect_item = False
+    while True:
+        token = next_token()
+        if token == "]" and not expect_item:
+            break
+        if token == "":
+            raise json.JSONDecodeError("Unterminated JSON array", buffer, position)
+
+        # Decode the next item, reading more while it runs past the end of the buffer
+        while True:
+            try:
+                item, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if at_end:
+                    raise
+                fill()
+                next_token()
+                continue
+            if not at_end and (end == len(buffer) or (isinstance(item, (int, float))
+                                                      and buffer[end] in "0123456789.eE+-")):
+                # A number cut off by the chunk boundary would decode as a shorter one
+                fill()
+                next_token()
+                continue
+            break
+        position = end
+        yield item
+
+        token = next_token()
+        if token == ",":
+            position += 1
+            expect_item = True
+        elif token == "]":
+            break
+        else:
+            raise json.JSONDecodeError("Expected ',' or ']'", buffer, position)
+
+    position += 1
+    if next_token() != "":
+        raise json.JSONDecodeError("Extra data", buffer, position)
+
+
+def read_records(path: str):
+    """Reads records from newline-delimited JSON or a JSON array, yielding one at a time.
+    The layout is decided from the first non-blank character: an array is decoded item by item whatever its layout,
+    anything else is read one record per line.
+    Args:
+        path : str
+            Path + filename of the input file.
+    Returns:
+        generator
+            Each record as a dict.
+    """
+
+    with open(path, encoding="utf8") as json_file:
+        first_line = json_file.readline()
+        while first_line and not first_line.strip():
+            first_line = json_file.readline()
+
+        if first_line.lstrip().startswith("["):
+            json_file.seek(0)
+            yield from iter_json_array(json_file)
+            return
+
+        # Newline-delimited JSON
+        if first_line.strip():
+            yield json.loads(first_line)
+        for line in json_file:
+            if line.strip():
+                yield json.loads(line)
@@ -0,0 +1,65 @@
+import ast
+from functools import lru_cache
+
+import pandas as pd
+
+
+# Bounded so that streaming a large file of mostly distinct cells keeps memory flat
+@lru_cache(maxsize=2**16)
+def _parse_list_string(value: str):
+    try:
+        parsed = ast.literal_eval(value)
+    except (ValueError, SyntaxError) as error:
+        raise ValueError("Malformed list cell: {!r}".format(value)) from error
+    if not isinstance(parsed, (list, tuple)):
+        raise ValueError("Expected a list, got {!r}".format(value))
+    return tuple(parsed)
+
+
+def parse_list_cell(value):
+    """Decodes one stringified list cell such as "['attach', 'move']" without executing it.
+    Repeated strings are only parsed once.
+    Args:
+        value : str | list
+            The cell value; lists are returned as they are and empty or missing cells become [].
+    Returns:
+        list
+            The decoded list.
+    Raises:
+        ValueError
+            If the cell is not a Python list literal.
+    """
+
+    if isinstance(value, (list, tuple)):
+        return list(value)
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return []
+    value = value.strip()
+    if not value:
+        return []
+    return list(_parse_list_string(value))
+
+
+def decode_list_column(column: pd.Series):
+    """Decodes a whole column of stringified lists, parsing each distinct value once.
+    Args:
+        column : pd.Series
+            Column of stringified lists, lists or missing values.
+    Returns:
+        pd.Series
+            A column of lists with the same index.
+    Raises:
+        ValueError
+            If any cell is not a Python list literal.
+    """
+
+    decoded = {}
+    values = []
+    for value in column.tolist():
+        if isinstance(value, str):
+            if value not in decoded:
+                decoded[value] = parse_list_cell(value)
+            values.append(list(decoded[value]))
+        else:
+            values.append(parse_list_cell(value))
+    return pd.Series(values, index=column.index, dtype=object)
@@ -0,0 +1,31 @@
+import re
+
+DOI_PATTERN = re.compile(r'\b(10[.][0-9]{4,}(?:[.][0-9]+)*/(?:(?![\"&\'<>])\S)+)\b')
+PAPER_PATTERN = re.compile(r"W\d+$", re.IGNORECASE)
+
+
+def normalize_doi(value):
+    if not isinstance(value, str):
+        return ""
+    doi = DOI_PATTERN.search(value)
+    return doi.group().upper() if doi else ""
+
+
+def normalize_url(value):
+    """Reduces a URL to host and path so that scheme, "www.", case and trailing slashes do not matter."""
+
+    if not isinstance(value, str):
+        return ""
+    url = value.strip().lower()
+    url = re.sub(r"^https?://", "", url)
+    url = re.sub(r"^www\.", "", url)
+    return url.rstrip("/")
+
+
+def normalize_paper_id(value):
+    """Reduces an Open Alex work ID or URL such as https://openalex.org/W123 to W123."""
+
+    if not isinstance(value, str):
+        return ""
+    paper = PAPER_PATTERN.search(value.strip())
+    return paper.group().upper() if paper else ""
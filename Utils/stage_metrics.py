@@ -0,0 +1,91 @@
+import json
+import os
+import time
+
+METRICS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Metrics")
+
+
+class StageMetrics:
+    """Collects wall time, throughput, HTTP and cache counts for one pipeline stage and writes them as a DVC metrics file.
+    Use it as a context manager around the stage; the file is written when the block exits, even on failure.
+    Args:
+        stage : str
+            Name of the DVC stage, used for the file name Metrics/<stage>.json.
+        path : str
+            Optional path of the metrics file to write instead.
+    """
+
+    def __init__(self, stage: str, path: str = None):
+        self.stage = stage
+        self.path = path or os.path.join(METRICS_DIR, stage + ".json")
+        self.rows = 0
+        self.counters = {}
+        self.clients = []
+        self.caches = []
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.counters["succeeded"] = exc_type is None
+        self.write()
+
+    def add(self, name: str, value: float = 1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def track_client(self, client):
+        """Includes an HttpClient's request, byte and retry counts in the metrics."""
+
+        self.clients.append(client)
+
+    def track_cache(self, cache):
+        """Includes a cache's hit and miss counts in the metrics."""
+
+        self.caches.append(cache)
+
+    def to_dict(self):
+        wall_time = time.perf_counter() - self.start
+        metrics = {
+            "wall_time_s": round(wall_time, 3),
+            "rows": self.rows,
+            "rows_per_s": round(self.rows / wall_time, 3) if wall_time else 0,
+        }
+        if self.clients:
+            metrics["http_requests"] = sum(client.requests for client in self.clients)
+            metrics["http_bytes"] = sum(client.bytes for client in self.clients)
+            metrics["http_retries"] = sum(client.retries for client in self.clients)
+        if self.caches:
+            metrics["cache_hits"] = sum(cache.hits for cache in self.caches)
+            metrics["cache_misses"] = sum(cache.misses for cache in self.caches)
+            metrics["cache_stale_hits"] = sum(getattr(cache, "stale_hits", 0) for cache in self.caches)
+        metrics.update(self.counters)
+        return metrics
+
+    def write(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, "w") as metrics_file:
+            json.dump({self.stage: self.to_dict()}, metrics_file, indent=4)
+
+
+class ProgressPrinter:
+    """Prints progress through `total` items only when it has moved on by at least `step`, instead of on every item.
+    Args:
+        total : int
+            Number of items to process.
+        step : float
+            Fraction of progress between prints.
+    """
+
+    def __init__(self, total: int, step: float = 0.05):
+        self.total = total
+        self.step = step
+        self.last_printed = None
+
+    def update(self, done: int):
+        fraction = done / self.total if self.total else 1
+        if (self.last_printed is None or fraction - self.last_printed >= self.step
+                or done == self.total):
+            self.last_printed = fraction
+            print("Progress: {0:0.2%}".format(fraction))